@@ -1,51 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from models.database import *
-from models.api import *
+import models.api as api
+from models.api.rate_limit import RateLimiter
+from models.api.registry import platforms
+import models.rollup as rollup
+import utils.http
+from time import monotonic
+import os
 
+# Platform name -> (token model, credentials extractor, client factory)
+PLATFORMS = {
+    'LINKEDIN': (LinkedInToken,
+                 lambda token: (token.token,),
+                 lambda token: api.LinkedInAPI(token, company=None)),
+    'TUMBLR': (TumblrToken,
+               lambda token: (token.token, token.token_secret),
+               lambda token, token_secret: api.TumblrAPI(token, token_secret, blogname=None)),
+    'TWITTER': (TwitterToken,
+                lambda token: (token.token, token.token_secret),
+                lambda token, token_secret: api.TwitterAPI(token, token_secret)),
+}
 
-def stats_snapshot():
-    linkedin_platform_id = Platform.query.filter_by(name='LINKEDIN').one().id
-    tumblr_platform_id = Platform.query.filter_by(name='TUMBLR').one().id
-    twitter_platform_id = Platform.query.filter_by(name='TWITTER').one().id
 
-    stats_fields = ['comments_avg', 'comments_sum', 'likes_avg', 'likes_sum', 'shares_avg', 'shares_sum']
+class SnapshotJob:
 
-    for token in LinkedInToken.query.all():
-        try:
-            client = LinkedInAPI(token.token)
-            followers_row = FollowersCount(token.user_id, linkedin_platform_id, client.get_profile()['followers'], True)
-            stats = client.posts_stats()
-            stats_row = Stats(token.user_id, linkedin_platform_id,
-                              *[stats[stats_field] for stats_field in stats_fields])
-            db.session.add(followers_row)
-            db.session.add(stats_row)
-        except:
-            pass
-
-    for token in TumblrToken.query.all():
-        try:
-            client = TumblrAPI(token.token, token.token_secret)
-            followers_row = FollowersCount(token.user_id, tumblr_platform_id, client.get_profile()['followers'], True)
-            stats = client.posts_stats()
-            stats_row = Stats(token.user_id, tumblr_platform_id,
-                              *[stats[stats_field] for stats_field in stats_fields])
-            db.session.add(followers_row)
-            db.session.add(stats_row)
-        except:
-            pass
-
-    for token in TwitterToken.query.all():
-        try:
-            client = TwitterAPI(token.token, token.token_secret)
-            followers_row = FollowersCount(token.user_id, twitter_platform_id, client.get_profile()['followers'], True)
+    def __init__(self, job_id, platform_name, platform_id, user_id, client_factory, credentials):
+        self.job_id = job_id
+        self.platform_name = platform_name
+        self.platform_id = platform_id
+        self.user_id = user_id
+        self.client_factory = client_factory
+        self.credentials = credentials
+
+
+class SnapshotEngine:
+
+    def __init__(self, workers, token_timeout):
+        self._workers = workers
+        self._token_timeout = token_timeout
+        self._started = {}
+
+    @property
+    def token_timeout(self):
+        return self._token_timeout
+
+    def run(self, jobs):
+        executors = {platform_name: ThreadPoolExecutor(max_workers=self._workers[platform_name],
+                                                       thread_name_prefix=f'snapshot-{platform_name.lower()}')
+                     for platform_name in self._workers}
+
+        pending = {executors[job.platform_name].submit(self._snapshot, job): job for job in jobs}
+        results = []
+        timed_out = {}
+        report = {platform_name: {'ok': 0, 'failed': 0, 'timed_out': 0, 'still_running': 0}
+                  for platform_name in self._workers}
+
+        while pending:
+            done, _ = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                job = pending.pop(future)
+                try:
+                    results.append((job, *future.result()))
+                    report[job.platform_name]['ok'] += 1
+                except Exception as e:
+                    print(f'Snapshot failed for user {job.user_id} on {job.platform_name}: {e!r}')
+                    report[job.platform_name]['failed'] += 1
+
+            now = monotonic()
+            for future, job in list(pending.items()):
+                started_at = self._started.get(job.job_id)
+                if started_at is not None and now - started_at > self._token_timeout:
+                    # The job's requests are past its deadline and fail on their own, only work between two requests
+                    # can outlive it. Its result is discarded either way.
+                    timed_out[future] = pending.pop(future)
+                    print(f'Snapshot timed out for user {job.user_id} on {job.platform_name}, '
+                          f'its thread is still running.')
+                    report[job.platform_name]['timed_out'] += 1
+
+        for future, job in timed_out.items():
+            if not future.done():
+                report[job.platform_name]['still_running'] += 1
+
+        for executor in executors.values():
+            executor.shutdown(wait=False)
+
+        return results, report
+
+    def _snapshot(self, job):
+        self._started[job.job_id] = monotonic()
+
+        with utils.http.deadline(self._token_timeout):
+            client = job.client_factory(*job.credentials)
+            followers = client.get_profile()['followers']
             stats = client.posts_stats()
-            stats_row = Stats(token.user_id, twitter_platform_id,
-                              *[stats[stats_field] for stats_field in stats_fields])
-            db.session.add(followers_row)
-            db.session.add(stats_row)
-        except:
-            pass
+
+        return followers, stats
+
+
+def stats_snapshot():
+    platform_ids = {platform.name: platform.id for platform in platforms.all()}
+
+    jobs = []
+    for platform_name, (token_cls, credentials, client_factory) in PLATFORMS.items():
+        for token in token_cls.query.all():
+            jobs.append(SnapshotJob(len(jobs), platform_name, platform_ids[platform_name], token.user_id,
+                                    client_factory, credentials(token)))
+
+    engine = SnapshotEngine(
+        workers={platform_name: int(os.getenv(f'SNAPSHOT_WORKERS_{platform_name}', 8)) for platform_name in PLATFORMS},
+        token_timeout=float(os.getenv('SNAPSHOT_TOKEN_TIMEOUT', 120))
+    )
+
+    # Unlike a web request the snapshot can afford to wait for a rate limit window to reopen
+    RateLimiter.MAX_WAIT = engine.token_timeout
+
+    start = monotonic()
+    results, report = engine.run(jobs)
+    elapsed = monotonic() - start
+
+    for job, followers, stats in results:
+        followers_row = FollowersCount(job.user_id, job.platform_id, followers, True)
+        stats_row = Stats(job.user_id, job.platform_id, *[stats[stats_field] for stats_field in STATS_FIELDS])
+        db.session.add(followers_row)
+        db.session.add(stats_row)
+        rollup.record_followers(followers_row)
+        rollup.record_stats(stats_row)
 
     db.session.commit()
 
+    for platform_name, counts in report.items():
+        print(f"{platform_name}: {counts['ok']} ok, {counts['failed']} failed, {counts['timed_out']} timed out "
+              f"({counts['still_running']} still running)")
+
+    print(f'Snapshot of {len(jobs)} accounts took {elapsed:.1f}s '
+          f'({len(jobs) / elapsed if elapsed else 0:.2f} accounts/sec).')
+
 
 stats_snapshot()
@@ -0,0 +1,3 @@
+import models.jobs as jobs
+
+jobs.work()
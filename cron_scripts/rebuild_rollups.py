@@ -0,0 +1,3 @@
+import models.rollup as rollup
+
+rollup.rebuild()
@@ -0,0 +1,25 @@
+import os
+
+# With preload the app is imported once in the master and the workers fork from it, instead of each worker importing
+# everything again. Set GUNICORN_PRELOAD=0 to fall back to importing in every worker.
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+# Threaded workers serve several requests at once, so a request hashing a password only holds up the others once
+# more of them hash at the same time than utils.password has workers for
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+
+def when_ready(server):
+    # Runs in the master before the first fork, the platform clients are imported here so that the workers inherit
+    # them already loaded
+    if preload_app:
+        import models.api as api
+        for client in ('LinkedInAPI', 'TumblrAPI', 'TwitterAPI'):
+            getattr(api, client)
+
+
+def post_fork(server, worker):
+    # Database connections opened by the master must never be shared between processes
+    from app import db
+    db.engine.dispose()
@@ -1,3 +1,15 @@
-from models.api.linkedin.client import LinkedInAPI
-from .tumblr import TumblrAPI
-from .twitter import TwitterAPI
+import importlib
+
+# Each client pulls in its platform library (python-twitter, pytumblr, requests_oauthlib), so they are only imported
+# on first use: models.api.TwitterAPI or `from models.api import TwitterAPI` inside the code that needs it
+_CLIENTS = {
+    'LinkedInAPI': 'models.api.linkedin.client',
+    'TumblrAPI': 'models.api.tumblr',
+    'TwitterAPI': 'models.api.twitter',
+}
+
+
+def __getattr__(name):
+    if name in _CLIENTS:
+        return getattr(importlib.import_module(_CLIENTS[name]), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
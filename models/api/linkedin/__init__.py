@@ -1,2 +1,9 @@
-from .client import LinkedInAPI
 from .error import LinkedInError
+import importlib
+
+
+def __getattr__(name):
+    # Imported on first use like the other clients, see models.api
+    if name == 'LinkedInAPI':
+        return importlib.import_module('.client', __name__).LinkedInAPI
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,27 +1,61 @@
 from requests_oauthlib import OAuth2Session
 from models import Profile, PostView, ImageEmbed
-from models.database import Platform
+from models.api.registry import PlatformAttribute
 from models.api.platform import PlatformAPI
+from models.api.rate_limit import RateLimiter, token_key
 from .error import LinkedInError
+from utils.cache import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
-import requests
+from itertools import takewhile
+import utils.http
 import urllib
 import json
+import os
 import re
 
 
+class _LinkedInSession(OAuth2Session):
+
+    def __init__(self, rate_limiter, token, *args, **kwargs):
+        OAuth2Session.__init__(self, *args, **kwargs)
+        utils.http.mount(self)
+        self._rate_limiter = rate_limiter
+        self._token_key = token
+
+    def request(self, method, url, *args, **kwargs):
+        def send():
+            # A retry after a 429 uploads a streamed body again from its start
+            if hasattr(kwargs.get('data'), 'seek'):
+                kwargs['data'].seek(0)
+            return OAuth2Session.request(self, method, url, *args, **kwargs)
+
+        return self._rate_limiter.call(self._token_key, url, send)
+
+
 class LinkedInAPI(PlatformAPI):
-    PLATFORM = Platform.query.filter_by(name='LINKEDIN').one()
-    CLIENT_KEY = PLATFORM.client_key
-    CLIENT_SECRET = PLATFORM.client_secret
+    PLATFORM = PlatformAttribute('LINKEDIN')
+    CLIENT_KEY = PlatformAttribute('LINKEDIN', 'client_key')
+    CLIENT_SECRET = PlatformAttribute('LINKEDIN', 'client_secret')
+
+    # LinkedIn doesn't send quota headers, only 429s once a daily throttle is hit
+    RATE_LIMITER = RateLimiter('LINKEDIN', token_limit=(100000, 24 * 60 * 60),
+                               app_limits={'daily': (100000, 24 * 60 * 60)})
+
+    PAGE_SIZE = 50
+
+    # Organization names almost never change; the administered organizations of a member only occasionally
+    ORGANIZATION_NAMES = TTLCache(max_size=10000, ttl=int(os.getenv('LINKEDIN_ORGANIZATION_NAME_TTL', 24 * 60 * 60)))
+    ADMINISTERED_ORGANIZATIONS = TTLCache(max_size=10000,
+                                          ttl=int(os.getenv('LINKEDIN_ORGANIZATION_ACL_TTL', 10 * 60)))
 
     @staticmethod
     def generate_auth_url(callback_url):
         # Step 1
         authorization_base_url = 'https://www.linkedin.com/oauth/v2/authorization'
-        linkedin = OAuth2Session(LinkedInAPI.CLIENT_KEY, redirect_uri=callback_url,
-                                 scope=['r_liteprofile', 'r_organization_social', 'w_organization_social',
-                                        'rw_organization_admin'])
+        linkedin = utils.http.mount(OAuth2Session(LinkedInAPI.CLIENT_KEY, redirect_uri=callback_url,
+                                                  scope=['r_liteprofile', 'r_organization_social',
+                                                         'w_organization_social', 'rw_organization_admin']))
 
         authorization_url, state = linkedin.authorization_url(authorization_base_url)
         return authorization_url
@@ -29,21 +63,24 @@ class LinkedInAPI(PlatformAPI):
     @staticmethod
     def generate_auth_token(callback_url, url):
         # Step 2
-        linkedin = OAuth2Session(LinkedInAPI.CLIENT_KEY, redirect_uri=callback_url)
+        linkedin = utils.http.mount(OAuth2Session(LinkedInAPI.CLIENT_KEY, redirect_uri=callback_url))
         return linkedin.fetch_token('https://www.linkedin.com/oauth/v2/accessToken',
                                     client_secret=LinkedInAPI.CLIENT_SECRET,
                                     include_client_id=True,
                                     authorization_response=url)
 
     def __init__(self, token, company):
-        self._client = OAuth2Session(LinkedInAPI.CLIENT_KEY, token={'access_token': token})
+        self._companies = None
+        self._token_key = token_key(token)
+        self._client = _LinkedInSession(self.RATE_LIMITER, self._token_key, LinkedInAPI.CLIENT_KEY,
+                                        token={'access_token': token})
         self._company = company or self._get_default_organization_urn()
 
     def get_profile(self):
         profile = self._get_profile()
         followers = self._get_followers()
         companies = self.get_companies_id()
-        companies_names = {company: self.get_company_name(company) for company in companies}
+        companies_names = self.get_companies_names(companies)
 
         post_id = profile['id']
         followers = followers['firstDegreeSize']
@@ -60,42 +97,77 @@ class LinkedInAPI(PlatformAPI):
         return Profile(profile, post_id, followers, name=name, bio=bio, profile_picture=profile_picture,
                        pages=companies, pages_names=companies_names).as_dict()
 
-    def get_companies_id(self):
+    def get_companies_id(self, refresh=False):
+        if refresh:
+            self._companies = None
+            self.ADMINISTERED_ORGANIZATIONS.pop(self._token_key)
+
         return [company['organizationalTarget'] for company in self._get_companies()['elements']]
 
     def get_company_name(self, company_id):
-        company_id = company_id.split(':')[-1]
-        company = json.loads(self._client.get('https://api.linkedin.com/v2/organizations/' + company_id).content.decode())
-        return company['localizedName']
+        name = self.ORGANIZATION_NAMES.get(company_id)
+
+        if name is None:
+            company = json.loads(self._client.get(
+                'https://api.linkedin.com/v2/organizations/' + company_id.split(':')[-1]
+            ).content.decode())
+            name = company['localizedName']
+            self.ORGANIZATION_NAMES.set(company_id, name)
+
+        return name
+
+    def get_companies_names(self, companies_ids):
+        names = {company_id: self.ORGANIZATION_NAMES.get(company_id) for company_id in companies_ids}
+        missing = [company_id for company_id, name in names.items() if name is None]
+
+        if missing:
+            response = self._client.get('https://api.linkedin.com/v2/organizations?' +
+                                        '&'.join(f"ids={company_id.split(':')[-1]}" for company_id in missing))
+
+            if response.ok:
+                results = json.loads(response.content.decode()).get('results', {})
+                for company_id in missing:
+                    company = results.get(company_id.split(':')[-1], None)
+                    if company:
+                        names[company_id] = company['localizedName']
+                        self.ORGANIZATION_NAMES.set(company_id, company['localizedName'])
+
+            # Whatever the batch call couldn't resolve is fetched one by one, concurrently
+            missing = [company_id for company_id in missing if names[company_id] is None]
+            if missing:
+                with ThreadPoolExecutor(max_workers=min(len(missing), 8)) as executor:
+                    names.update(zip(missing, utils.http.map_within_deadline(executor, self.get_company_name,
+                                                                             missing)))
+
+        return names
 
     def get_post(self, post_id):
         post = self._get_post(post_id)
-        stats = self._get_post_stats(post_id)
-        return self._get_post_view(post, stats)
+        stats = self._get_posts_stats([post_id])
+        return self._get_post_view(post, stats.get(post_id, None))
 
     def get_posts(self):
-        posts = {}
-
         current_week_no = date.today().isocalendar()[1]
-        i = 0
-        posts_exist = True
+        posts = self._get_self_posts_while(
+            lambda post: datetime.fromtimestamp(post['created']['time'] // 1e3).isocalendar()[1] == current_week_no)
 
-        while posts_exist:
-            posts_exist = False
-            for post in self._get_self_posts(0 + i * 20, 20)['elements']:
-                if datetime.fromtimestamp(post['created']['time'] // 1e3).isocalendar()[1] != current_week_no:
-                    break
-                posts[post['id']] = self._get_post_view(post, self._get_post_stats(post['id']))
-                posts_exist = True
-            i += 1
+        return {'posts': posts}
 
-        return {'posts': list(posts.values())}
+    def get_posts_since(self, high_water, refresh_after):
+        after = min(refresh_after * 1e3, float(high_water)) if high_water else refresh_after * 1e3
+        posts = self._get_self_posts_while(lambda post: post['created']['time'] > after)
 
-    def post(self, post_draft):
-        files = [self._upload_file(file) for file in post_draft.files]
+        if posts:
+            high_water = max(post['created_at'] for post in posts) * 1e3
+
+        return posts, high_water and str(int(float(high_water)))
 
-        files_from_url = [requests.get(file) for file in post_draft.files_url]
-        files.extend([self._upload_file(file_raw=file) for file in files_from_url])
+    @property
+    def page_id(self):
+        return self._company
+
+    def post(self, post_draft):
+        files = [self._upload_file(media) for media in post_draft.media]
 
         request_json = {
             'author': self._company,
@@ -141,13 +213,24 @@ class LinkedInAPI(PlatformAPI):
             ).content.decode())
 
     def _get_companies(self):
-        companies = json.loads(
-            self._client.get(
-                'https://api.linkedin.com/v2/organizationalEntityAcls?q=roleAssignee&role=ADMINISTRATOR'
-            ).content.decode())
-        if len(companies['elements']) < 1:
-            raise LinkedInError(404, 'User has no company.')
-        return companies
+        if self._companies is None:
+            self._companies = self.ADMINISTERED_ORGANIZATIONS.get(self._token_key)
+
+        if self._companies is None:
+            response = self._client.get(
+                'https://api.linkedin.com/v2/organizationalEntityAcls?q=roleAssignee&role=ADMINISTRATOR')
+            companies = json.loads(response.content.decode())
+
+            if not response.ok:
+                raise LinkedInError(response.status_code, companies.get('message', 'Organizations unavailable.'))
+            if len(companies.get('elements', [])) < 1:
+                # Not cached either, the member may be granted a page any moment
+                raise LinkedInError(404, 'User has no company.')
+
+            self._companies = companies
+            self.ADMINISTERED_ORGANIZATIONS.set(self._token_key, self._companies)
+
+        return self._companies
 
     def _get_default_organization_urn(self):
         return self._get_companies()['elements'][-1]['organizationalTarget']
@@ -159,6 +242,25 @@ class LinkedInAPI(PlatformAPI):
             f'&start={start}&count={count}'
         ).content.decode())
 
+    def _get_self_posts_while(self, keep):
+        # Shares come newest first, paging stops at the first one that isn't kept
+        posts = {}
+        start = 0
+
+        while True:
+            page = self._get_self_posts(start, self.PAGE_SIZE)['elements']
+            kept = list(takewhile(keep, page))
+
+            stats = self._get_posts_stats([post['id'] for post in kept])
+            for post in kept:
+                posts[post['id']] = self._get_post_view(post, stats.get(post['id'], None))
+
+            if not kept or len(kept) < len(page):
+                break
+            start += self.PAGE_SIZE
+
+        return list(posts.values())
+
     def _get_self_posts2(self):
         self._client.headers.update({'X-Restli-Protocol-Version': '2.0.0'})
 
@@ -170,14 +272,19 @@ class LinkedInAPI(PlatformAPI):
     def _get_post(self, post_id):
         return json.loads(self._client.get('https://api.linkedin.com/v2/shares/' + post_id).content.decode())
 
-    def _get_post_stats(self, post_id):
-        organization_urn = self._get_companies()['elements'][0]['organizationalTarget']
+    def _get_posts_stats(self, post_ids):
+        if not post_ids:
+            return {}
 
-        return json.loads(self._client.get(
+        # One request covers a whole page of shares
+        shares = '&'.join(f'shares[{i}]=urn:li:share:{post_id}' for i, post_id in enumerate(post_ids))
+        stats = json.loads(self._client.get(
             'https://api.linkedin.com/v2/organizationalEntityShareStatistics?q=organizationalEntity'
-            f'&organizationalEntity={organization_urn}&shares[0]=urn:li:share:{post_id}'
+            f'&organizationalEntity={self._company}&{shares}'
         ).content.decode())
 
+        return {element['share'].split(':')[-1]: element for element in stats.get('elements', [])}
+
     @staticmethod
     def _get_post_view(post, stats):
         post_id = id = post['id']
@@ -187,10 +294,10 @@ class LinkedInAPI(PlatformAPI):
         shares = 0
         comments_count = 0
 
-        if stats['elements']:
-            likes = stats['elements'][0]['totalShareStatistics']['likeCount']
-            shares = stats['elements'][0]['totalShareStatistics']['commentCount']
-            comments_count = stats['elements'][0]['totalShareStatistics']['commentCount']
+        if stats:
+            likes = stats['totalShareStatistics']['likeCount']
+            shares = stats['totalShareStatistics']['shareCount']
+            comments_count = stats['totalShareStatistics']['commentCount']
 
         text = post['text']['text']
         hashtags = re.findall('#([^ .]+)', text)
@@ -207,7 +314,7 @@ class LinkedInAPI(PlatformAPI):
         return PostView(post, post_id, timestamp, likes, shares, comments_count, text=text, hashtags=hashtags,
                         embeds=embeds).as_dict()
 
-    def _upload_file(self, file=None, file_raw=None):
+    def _upload_file(self, media):
         # Step 1
         data = json.loads(self._client.post(
             f'https://api.linkedin.com/v2/assets?action=registerUpload',
@@ -235,6 +342,6 @@ class LinkedInAPI(PlatformAPI):
             'uploadUrl']
 
         # Step 2
-        data = self._client.put(upload_url, headers={'Content-Type': 'image/jpeg,image/png,image/gif'},
-                                data=file_raw or file.read())
+        # Streamed from the draft's buffer rather than read into memory first
+        data = self._client.put(upload_url, headers={'Content-Type': media.content_type}, data=media.open())
         return urn
@@ -3,6 +3,10 @@ from abc import ABC
 
 class PlatformAPI(ABC):
 
+    @property
+    def page_id(self):
+        return ''
+
     def get_profile(self):
         raise NotImplementedError
 
@@ -12,14 +16,23 @@ class PlatformAPI(ABC):
     def get_posts(self):
         raise NotImplementedError
 
+    def get_posts_since(self, high_water, refresh_after):
+        # Returns the posts newer than the high water mark or than refresh_after (a unix timestamp), whichever is
+        # older, together with the new high water mark
+        raise NotImplementedError
+
     def post(self, post_draft):
         raise NotImplementedError
 
     def delete_post(self, post_id):
         raise NotImplementedError
 
-    def posts_stats(self):
-        posts = self.get_posts()['posts']
+    def rate_limit_budget(self):
+        return self.RATE_LIMITER.budget(self._token_key)
+
+    def posts_stats(self, posts=None):
+        if posts is None:
+            posts = self.get_posts()['posts']
 
         likes = []
         shares = []
@@ -50,5 +63,8 @@ class PlatformAPI(ABC):
 
         return stats
 
-    def get_posts_ranked(self, ranking_key):
-        return {'posts': sorted(self.get_posts()['posts'], key=lambda post: post[ranking_key], reverse=True)}
+    def get_posts_ranked(self, ranking_key, posts=None):
+        if posts is None:
+            posts = self.get_posts()['posts']
+
+        return {'posts': sorted(posts, key=lambda post: post[ranking_key], reverse=True)}
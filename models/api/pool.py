@@ -0,0 +1,31 @@
+from utils.cache import TTLCache
+import os
+
+
+class ClientPool:
+    # Platform clients resolve things over the network when built (Tumblr blog name, LinkedIn organization URN)
+    # and memoize others on first use (Twitter user id), so each worker keeps them around between requests
+
+    def __init__(self, max_size, ttl):
+        self._clients = TTLCache(max_size, ttl)
+
+    def get(self, user_id, platform, page, credentials, factory):
+        key = (user_id, platform, page)
+        entry = self._clients.get(key)
+
+        # Tokens may be replaced by another worker, a pooled client is only reused for the same credentials
+        if entry and entry[0] == credentials:
+            return entry[1]
+
+        client = factory(*credentials)
+        self._clients.set(key, (credentials, client))
+        return client
+
+    def invalidate(self, user_id, platform=None):
+        for key in self._clients.keys():
+            if key[0] == user_id and (platform is None or key[1] == platform):
+                self._clients.pop(key)
+
+
+client_pool = ClientPool(max_size=int(os.getenv('CLIENT_POOL_SIZE', 256)),
+                         ttl=int(os.getenv('CLIENT_POOL_TTL', 15 * 60)))
@@ -0,0 +1,180 @@
+from threading import Lock
+from time import time, sleep
+from hashlib import sha256
+from urllib.parse import urlparse
+import utils.http
+import re
+import os
+
+
+class RateLimitError(Exception):
+
+    def __init__(self, platform, retry_after):
+        self._platform = platform
+        self._retry_after = retry_after
+
+    @property
+    def platform(self):
+        return self._platform
+
+    @property
+    def retry_after(self):
+        return self._retry_after
+
+    @property
+    def message(self):
+        return f'{self._platform} rate limit exhausted, retry in {int(self._retry_after) + 1} seconds.'
+
+
+def token_key(*credentials):
+    # Buckets are keyed by a digest so raw tokens don't linger in memory as dict keys
+    return sha256(':'.join(credentials).encode()).hexdigest()[:16]
+
+
+class TokenBucket:
+
+    def __init__(self, capacity, window):
+        self.capacity = capacity
+        self.window = window
+        self.tokens = capacity
+        self.reset_at = None
+        self.updated_at = time()
+
+    def delay(self, now):
+        self._refill(now)
+
+        if self.tokens >= 1:
+            return 0
+        if self.reset_at is not None:
+            return self.reset_at - now
+        return (1 - self.tokens) * self.window / self.capacity
+
+    def take(self):
+        self.tokens -= 1
+
+    def update(self, limit, remaining, reset_at, now):
+        # Platform headers are authoritative: switch from continuous refill to the platform's fixed window
+        self._refill(now)
+        if limit:
+            self.capacity = limit
+        self.tokens = remaining
+        self.reset_at = reset_at
+        self.updated_at = now
+
+    def as_dict(self, now):
+        self._refill(now)
+        return {
+            'limit': self.capacity,
+            'remaining': max(int(self.tokens), 0),
+            'reset': self.reset_at
+        }
+
+    def _refill(self, now):
+        if self.reset_at is not None:
+            if now >= self.reset_at:
+                self.tokens = self.capacity
+                self.reset_at = None
+        else:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.capacity / self.window)
+        self.updated_at = now
+
+
+class RateLimiter:
+    MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', 30))
+    MAX_RETRIES = 2
+    MAX_BUCKETS = 10000
+
+    # token_limit and app_limits values are (capacity, window in seconds); parse_headers maps a response to
+    # [(scope, name, limit, remaining, reset_at)] with scope 'token' or 'app'. Twitter limits each endpoint
+    # separately, hence per_resource.
+    def __init__(self, platform, token_limit, app_limits, parse_headers=None, per_resource=False):
+        self._platform = platform
+        self._token_limit = token_limit
+        self._parse_headers = parse_headers
+        self._per_resource = per_resource
+
+        self._lock = Lock()
+        self._app_buckets = {name: TokenBucket(*limit) for name, limit in app_limits.items()}
+        self._token_buckets = {}
+
+    def call(self, token, url, send):
+        for _ in range(self.MAX_RETRIES + 1):
+            self.acquire(token, url)
+            response = send()
+            self.update(token, url, response)
+
+            if response.status_code != 429:
+                break
+
+        return response
+
+    def acquire(self, token, url):
+        waited = 0
+
+        while True:
+            with self._lock:
+                now = time()
+                buckets = [self._token_bucket(token, url, now), *self._app_buckets.values()]
+                delay = max(bucket.delay(now) for bucket in buckets)
+
+                if delay <= 0:
+                    for bucket in buckets:
+                        bucket.take()
+                    return
+
+            # Never sleeps past the calling thread's deadline, its requests would fail by then anyway
+            remaining = utils.http.remaining_time()
+            if waited + delay > self.MAX_WAIT or (remaining is not None and delay > remaining):
+                raise RateLimitError(self._platform, delay)
+
+            sleep(delay)
+            waited += delay
+
+    def update(self, token, url, response):
+        now = time()
+        limits = self._parse_headers(response) if self._parse_headers else []
+
+        if response.status_code == 429 and not limits:
+            retry_after = float(response.headers.get('Retry-After', 60))
+            limits = [('token', None, None, 0, now + retry_after)]
+
+        with self._lock:
+            for scope, name, limit, remaining, reset_at in limits:
+                if scope == 'token':
+                    bucket = self._token_bucket(token, url, now)
+                else:
+                    bucket = self._app_buckets.get(name)
+                if bucket:
+                    bucket.update(limit, remaining, reset_at, now)
+
+    def budget(self, token):
+        now = time()
+
+        with self._lock:
+            return {
+                'token': {resource: bucket.as_dict(now)
+                          for (key, resource), bucket in self._token_buckets.items() if key == token},
+                'app': {name: bucket.as_dict(now) for name, bucket in self._app_buckets.items()}
+            }
+
+    def _token_bucket(self, token, url, now):
+        key = (token, self._resource(url))
+
+        if key not in self._token_buckets:
+            if len(self._token_buckets) >= self.MAX_BUCKETS:
+                self._prune(now)
+            self._token_buckets[key] = TokenBucket(*self._token_limit)
+
+        return self._token_buckets[key]
+
+    def _resource(self, url):
+        if not self._per_resource:
+            return 'default'
+        return re.sub(r'/\d+', '/:id', urlparse(url).path)
+
+    def _prune(self, now):
+        # Forget buckets that have refilled completely, they carry no information
+        for key, bucket in list(self._token_buckets.items()):
+            bucket.delay(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._token_buckets[key]
@@ -0,0 +1,50 @@
+from models.database import Platform
+from threading import Lock
+from app import db
+
+
+class PlatformRegistry:
+    # Every Platform row, loaded in one query on first use and kept, detached, for the life of the process
+
+    def __init__(self):
+        self._platforms = None
+        self._lock = Lock()
+
+    def get(self, name):
+        return self._loaded()[name]
+
+    def all(self):
+        return list(self._loaded().values())
+
+    def refresh(self):
+        with self._lock:
+            self._platforms = self._load()
+
+    def _loaded(self):
+        if self._platforms is None:
+            with self._lock:
+                if self._platforms is None:
+                    self._platforms = self._load()
+        return self._platforms
+
+    @staticmethod
+    def _load():
+        platforms = Platform.query.all()
+        for platform in platforms:
+            db.session.expunge(platform)
+        return {platform.name: platform for platform in platforms}
+
+
+class PlatformAttribute:
+    # Class attribute read from the registry on access, so that defining a client class needs no database
+
+    def __init__(self, name, attribute=None):
+        self._name = name
+        self._attribute = attribute
+
+    def __get__(self, instance, owner):
+        platform = platforms.get(self._name)
+        return platform if self._attribute is None else getattr(platform, self._attribute)
+
+
+platforms = PlatformRegistry()
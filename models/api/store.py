@@ -0,0 +1,116 @@
+from sqlalchemy.dialects.postgresql import insert
+from models.database import Post, PostSync
+from app import db
+from datetime import datetime, date, timedelta
+import os
+
+
+def _week_start():
+    today = date.today()
+    return datetime.combine(today - timedelta(days=today.weekday()), datetime.min.time())
+
+
+class PostStore:
+    SYNC_INTERVAL = timedelta(seconds=int(os.getenv('POST_SYNC_INTERVAL', 5 * 60)))
+    REFRESH_WINDOW = timedelta(seconds=int(os.getenv('POST_REFRESH_WINDOW', 2 * 24 * 60 * 60)))
+
+    def __init__(self, client, user_id):
+        self._client = client
+        self._user_id = user_id
+
+    def get_posts(self, force_sync=False):
+        self.sync(force=force_sync)
+
+        rows = self._query().filter(Post.timestamp >= _week_start()).order_by(Post.timestamp.desc()).all()
+
+        return {'posts': [row.view for row in rows]}
+
+    def sync(self, force=False):
+        now = datetime.now()
+        state = self._state().first()
+
+        if state and not force and self._fresh(state, now):
+            return
+
+        high_water, version = (state.high_water, state.synced_at) if state else (None, None)
+
+        # The platform is called outside of any transaction, so that no lock and no pooled connection is held while
+        # it answers. Concurrent syncs of an account may both fetch, only the first to write is kept.
+        db.session.commit()
+
+        # Engagement mostly changes in the first days of a post, so only the refresh window is fetched again on top
+        # of whatever is newer than the high water mark. Older posts of the week keep the counts of their last
+        # refresh. The first sync has no high water mark yet and fetches the whole week.
+        refresh_after = now - self.REFRESH_WINDOW
+        if not high_water:
+            refresh_after = min(_week_start(), refresh_after)
+
+        posts, high_water = self._client.get_posts_since(high_water, refresh_after.timestamp())
+        post_ids = [post['id'] for post in posts]
+
+        # The row is only locked for the writes, the row is created first so that there always is one to lock
+        db.session.execute(insert(PostSync.__table__).values(
+            user_id=self._user_id, platform_id=self._client.PLATFORM.id, page_id=self._client.page_id
+        ).on_conflict_do_nothing(index_elements=['user_id', 'platform_id', 'page_id']))
+        state = self._state().with_for_update().populate_existing().one()
+
+        if state.synced_at != version:
+            # Synced or expired by someone else in the meantime, an expired store is synced again on the next read
+            db.session.commit()
+            return
+
+        # Whatever the platform no longer returns inside the refresh window has been deleted
+        deleted = self._query().filter(Post.timestamp > refresh_after)
+        if post_ids:
+            deleted = deleted.filter(Post.post_id.notin_(post_ids))
+        deleted.delete(synchronize_session=False)
+
+        if posts:
+            # A post showing up on two pages would hit the same row twice within the statement, the last copy wins
+            statement = insert(Post.__table__).values([
+                {'user_id': self._user_id, 'platform_id': self._client.PLATFORM.id, 'page_id': self._client.page_id,
+                 **Post.columns(post)} for post in {post['id']: post for post in posts}.values()
+            ])
+            update = {column: statement.excluded[column] for column in Post.columns(posts[0]) if column != 'post_id'}
+            update['updated_at'] = db.func.now()
+
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=['user_id', 'platform_id', 'post_id'], set_=update))
+
+        state.high_water = high_water
+        state.synced_at = now
+        db.session.commit()
+
+    def version(self):
+        # Changes with every sync and every write, in the database so that all the web workers see the same one
+        return db.session.query(PostSync.synced_at).filter_by(
+            user_id=self._user_id, platform_id=self._client.PLATFORM.id, page_id=self._client.page_id).scalar()
+
+    def expire(self):
+        self._expire()
+        db.session.commit()
+
+    def forget(self, post_id):
+        self._query().filter_by(post_id=post_id).delete(synchronize_session=False)
+        self._expire()
+        db.session.commit()
+
+    def _expire(self):
+        # Backdated by one interval rather than cleared, the next read syncs all the same and the version stays unique
+        statement = insert(PostSync.__table__).values(
+            user_id=self._user_id, platform_id=self._client.PLATFORM.id, page_id=self._client.page_id,
+            synced_at=datetime.now() - self.SYNC_INTERVAL
+        )
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['user_id', 'platform_id', 'page_id'], set_={'synced_at': statement.excluded.synced_at}))
+
+    def _fresh(self, state, now):
+        return state.synced_at is not None and state.synced_at > now - self.SYNC_INTERVAL
+
+    def _state(self):
+        return PostSync.query.filter_by(user_id=self._user_id, platform_id=self._client.PLATFORM.id,
+                                        page_id=self._client.page_id)
+
+    def _query(self):
+        return Post.query.filter_by(user_id=self._user_id, platform_id=self._client.PLATFORM.id,
+                                    page_id=self._client.page_id)
@@ -1,23 +1,76 @@
-from models.database import Platform
+from .registry import PlatformAttribute
 from models import Profile, PostView, ImageEmbed, VideoEmbed
 from .platform import PlatformAPI
+from .rate_limit import RateLimiter, token_key
+from .tumblr_notes import note_counts
 from requests_oauthlib import OAuth1Session
 from pytumblr import TumblrRestClient
-import uuid
-import os
+from pytumblr.request import TumblrRequest
+from time import time
 from datetime import datetime, date
-import requests
+import utils.http
+
+
+def _parse_rate_limit_headers(response):
+    limits = []
+
+    for window in ('hour', 'day'):
+        if f'X-Ratelimit-Per{window}-Remaining' in response.headers:
+            limits.append(('app', window, int(response.headers[f'X-Ratelimit-Per{window}-Limit']),
+                           int(response.headers[f'X-Ratelimit-Per{window}-Remaining']),
+                           time() + float(response.headers[f'X-Ratelimit-Per{window}-Reset'])))
+
+    return limits
+
+
+class _TumblrRequest(TumblrRequest):
+    # pytumblr calls requests directly, so the HTTP layer is replaced to route every call through the rate limiter
+    # and the shared connection pools
+
+    def __init__(self, rate_limiter, token, *args, **kwargs):
+        TumblrRequest.__init__(self, *args, **kwargs)
+        self._rate_limiter = rate_limiter
+        self._token_key = token
+
+    def get(self, url, params):
+        url = self.host + url
+        return self.json_parse(self._rate_limiter.call(self._token_key, url, lambda: utils.http.session.get(
+            url, params=params, allow_redirects=False, headers=self.headers, auth=self.oauth)))
+
+    def post(self, url, params={}, files=[]):
+        url = self.host + url
+
+        if files:
+            def send():
+                # A retry after a 429 uploads every file again from its start
+                for _, file, _ in files.values():
+                    file.seek(0)
+
+                # Multipart bodies aren't signed by OAuth1, so the parameters also travel in the query string
+                return utils.http.session.post(url, data=params, params=params, files=files, allow_redirects=False,
+                                               headers=self.headers, auth=self.oauth)
+        else:
+            send = lambda: utils.http.session.post(url, data=params, headers=self.headers, auth=self.oauth)
+
+        return self.json_parse(self._rate_limiter.call(self._token_key, url, send))
 
 
 class TumblrAPI(PlatformAPI, TumblrRestClient):
-    PLATFORM = Platform.query.filter_by(name='TUMBLR').one()
-    CLIENT_KEY = PLATFORM.client_key
-    CLIENT_SECRET = PLATFORM.client_secret
+    PLATFORM = PlatformAttribute('TUMBLR')
+    CLIENT_KEY = PlatformAttribute('TUMBLR', 'client_key')
+    CLIENT_SECRET = PlatformAttribute('TUMBLR', 'client_secret')
 
     REQUEST_TOKEN_URL = 'https://www.tumblr.com/oauth/request_token'
     AUTHORIZE_BASE_URL = 'https://www.tumblr.com/oauth/authorize'
     ACCESS_TOKEN_URL = 'https://www.tumblr.com/oauth/access_token'
 
+    RATE_LIMITER = RateLimiter('TUMBLR', token_limit=(1000, 60 * 60),
+                               app_limits={'hour': (1000, 60 * 60), 'day': (5000, 24 * 60 * 60)},
+                               parse_headers=_parse_rate_limit_headers)
+
+    # Largest page the posts endpoint returns
+    PAGE_SIZE = 20
+
     def __init__(self, oauth_token, oauth_token_secret, blogname):
         TumblrRestClient.__init__(
             self,
@@ -27,14 +80,18 @@ class TumblrAPI(PlatformAPI, TumblrRestClient):
             oauth_token_secret
         )
 
+        self._token_key = token_key(oauth_token, oauth_token_secret)
+        self.request = _TumblrRequest(self.RATE_LIMITER, self._token_key, TumblrAPI.CLIENT_KEY,
+                                      TumblrAPI.CLIENT_SECRET, oauth_token, oauth_token_secret)
+
         self.blogname = blogname or f"{self.info()['user']['name']}.tumblr.com"
 
     @staticmethod
     def generate_auth_req_token():
-        oauth_session = OAuth1Session(
+        oauth_session = utils.http.mount(OAuth1Session(
             TumblrAPI.CLIENT_KEY,
             client_secret=TumblrAPI.CLIENT_SECRET
-        )
+        ))
 
         tokens = oauth_session.fetch_request_token(TumblrAPI.REQUEST_TOKEN_URL)
         return tokens['oauth_token'], tokens['oauth_token_secret']
@@ -56,13 +113,13 @@ class TumblrAPI(PlatformAPI, TumblrRestClient):
         verifier = oauth_response.get('oauth_verifier')
 
         # Request final access token
-        oauth_session = OAuth1Session(
+        oauth_session = utils.http.mount(OAuth1Session(
             TumblrAPI.CLIENT_KEY,
             client_secret=TumblrAPI.CLIENT_SECRET,
             resource_owner_key=oauth_token,
             resource_owner_secret=oauth_secret,
             verifier=verifier
-        )
+        ))
 
         tokens = oauth_session.fetch_access_token(TumblrAPI.ACCESS_TOKEN_URL)
         return tokens['oauth_token'], tokens['oauth_token_secret']
@@ -80,44 +137,44 @@ class TumblrAPI(PlatformAPI, TumblrRestClient):
                        pages=self.get_blognames()).as_dict()
 
     def get_post(self, post_id):
-        return self._get_post_view(self._get_post(post_id))
+        return self._get_post_views([self._get_post(post_id)])[0]
 
     def delete_post(self, post_id):
         TumblrRestClient.delete_post(self, self.blogname, post_id)
 
     def get_posts(self):
-        profile = self.info()
         current_week_no = date.today().isocalendar()[1]
-        total_nr_of_posts = profile["user"]["blogs"][0]["posts"]
-        response = self.posts(self.blogname, limit=total_nr_of_posts)
-        posts = []
-        if 'posts' in response:
-            for post in response['posts']:
-                post_date_time = datetime.fromtimestamp(post['timestamp'])
-                if post_date_time.isocalendar()[1] == current_week_no:
-                    posts.append(self._get_post_view(post))
-        return {'posts': posts}
+        posts = self._get_posts_while(
+            lambda post: datetime.fromtimestamp(post['timestamp']).isocalendar()[1] == current_week_no)
+
+        return {'posts': self._get_post_views(posts)}
+
+    def get_posts_since(self, high_water, refresh_after):
+        after = min(refresh_after, float(high_water)) if high_water else refresh_after
+        posts = self._get_post_views(self._get_posts_while(lambda post: post['timestamp'] > after))
+
+        if posts:
+            high_water = max(post['created_at'] for post in posts)
+
+        return posts, high_water and str(high_water)
+
+    @property
+    def page_id(self):
+        return self.blogname
+
+    def _get_post_views(self, posts):
+        counts = note_counts.fetch(self.request, self.blogname, posts)
+        return [self._get_post_view(post, counts.get(post['id_string'], None)) for post in posts]
 
     @staticmethod
-    def _get_post_view(post):
+    def _get_post_view(post, counts):
         post_id = post['id_string']
         timestamp = post['timestamp']
         hashtags = post['tags']
-        likes = 0
-        shares = 0
-        comments_count = 0
+        likes, shares, comments_count = counts or (0, 0, 0)
         text = None
         embeds = []
 
-        if 'notes' in post:
-            for note in post['notes']:
-                if note['type'] == 'like':
-                    likes += 1
-                elif note['type'] == 'reblog':
-                    shares += 1
-                elif note['type'] == 'reply':
-                    comments_count += 1
-
         if post['type'] == 'text':
             text = post['body']
         elif post['type'] == 'chat':
@@ -141,8 +198,27 @@ class TumblrAPI(PlatformAPI, TumblrRestClient):
         return PostView(post, post_id, timestamp, likes, shares, comments_count, text=text, hashtags=hashtags,
                         embeds=embeds).as_dict()
 
+    def _get_posts_while(self, keep):
+        # Posts come newest first, paging stops at the first one that isn't kept. Pinned posts sit on top out of
+        # order, so they never end the paging.
+        posts = []
+        offset = 0
+
+        while True:
+            page = self.posts(self.blogname, offset=offset, limit=self.PAGE_SIZE).get('posts', [])
+
+            for post in page:
+                if keep(post):
+                    posts.append(post)
+                elif not post.get('is_pinned', False):
+                    return posts
+
+            if len(page) < self.PAGE_SIZE:
+                return posts
+            offset += self.PAGE_SIZE
+
     def _get_post(self, post_id):
-        response = self.posts(self.blogname, id=post_id, notes_info=True)
+        response = self.posts(self.blogname, id=post_id)
         return response['posts'][0]
 
     def get_blognames(self):
@@ -154,60 +230,18 @@ class TumblrAPI(PlatformAPI, TumblrRestClient):
         return blogNames
 
     def post(self, post_draft):
-        if post_draft.files:
-            files = dict()
-            for file in post_draft.files:
-                file_type = file.headers['Content-Type'].split('/')[0]
-                if file_type not in files:
-                    files[file_type] = []
-                temp_dir = os.getenv('TMP_FOLDER')
-                temp_name = "{}_{}".format(str(uuid.uuid1()), file.filename)
-                filepath = os.path.join(temp_dir, temp_name)
-                file.save(filepath)
-
-                print(filepath, file_type)
-
-                files[file_type].append(filepath)
-
-            if 'image' in files:
-                result = self.create_photo(self.blogname, data=files['image'], caption=post_draft.text)
-            elif 'video' in files:
-                result = self.create_video(self.blogname, data=files['video'], caption=post_draft.text)
-
-            for _type in files:
-                for filepath in files[_type]:
-                    os.remove(filepath)
-
-        elif post_draft.files_url:
-            files = dict()
-            for url in post_draft.files_url:
-
-                r = requests.head(url)
-
-                if r.ok:
-                    file_type = r.headers['Content-Type'].split('/')[0]
-
-                    if file_type not in files:
-                        files[file_type] = []
-
-                    temp_dir = os.getenv('TMP_FOLDER')
-                    temp_name = str(uuid.uuid1())
-                    filepath = os.path.join(temp_dir, temp_name)
-                    g = open(filepath, 'wb')
-                    g.write(requests.get(url).content)
-                    g.close()
-
-                    files[file_type].append(filepath)
-
-            if 'image' in files:
-                result = self.create_photo(self.blogname, data=files['image'], caption=post_draft.text)
-            elif 'video' in files:
-                result = self.create_video(self.blogname, data=files['video'], caption=post_draft.text)
-
-            for _type in files:
-                for filepath in files[_type]:
-                    os.remove(filepath)
-        else:
+        # Media is sent straight from the draft's buffers, pytumblr's create_photo/create_video only take file paths
+        url = f'/v2/blog/{self.blogname}/post'
+        images = [media for media in post_draft.media if media.kind == 'image']
+        videos = [media for media in post_draft.media if media.kind == 'video']
+
+        if images:
+            result = self.request.post(url, {'type': 'photo', 'caption': post_draft.text},
+                                       {f'data[{i}]': media.as_upload() for i, media in enumerate(images)})
+        elif videos:
+            result = self.request.post(url, {'type': 'video', 'caption': post_draft.text},
+                                       {'data': videos[0].as_upload()})
+        elif not post_draft.media:
             result = self.create_text(self.blogname, body=post_draft.text)
 
         # TODO  check result
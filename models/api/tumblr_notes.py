@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from utils.cache import TTLCache
+from .rate_limit import RateLimitError
+import requests
+import utils.http
+import os
+
+
+class NoteCountFetcher:
+    # Posts only carry note_count, likes, reblogs and replies are itemised by the notes endpoint 50 notes at a time
+    URL = '/v2/blog/{blogname}/notes'
+
+    def __init__(self, workers, ttl, max_size, max_pages):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tumblr-notes')
+        self._cache = TTLCache(max_size, ttl)
+        self._max_pages = max_pages
+
+    # Maps raw posts to {post_id: (likes, reblogs, replies)} for every post whose notes could be counted
+    def fetch(self, request, blogname, posts):
+        counts = {}
+        missing = []
+
+        for post in posts:
+            post_id, note_count = post['id_string'], post.get('note_count', 0)
+
+            # Without notes there is nothing to itemise, and an unchanged note count means unchanged counts
+            cached = self._cache.get(post_id)
+            if not note_count:
+                counts[post_id] = (0, 0, 0)
+            elif cached is not None and cached[0] == note_count:
+                counts[post_id] = cached[1]
+            else:
+                missing.append((post_id, note_count))
+
+        # Posts still being itemised when the caller's deadline passes are left without counts
+        results = utils.http.map_within_deadline(self._executor,
+                                                 lambda post: self._fetch_one(request, blogname, *post), missing)
+        for (post_id, note_count), result in zip(missing, results):
+            if result is not None:
+                self._cache.set(post_id, (note_count, result))
+                counts[post_id] = result
+
+        return counts
+
+    def _fetch_one(self, request, blogname, post_id, note_count):
+        types = Counter()
+        params = {'id': post_id, 'mode': 'all'}
+        truncated = False
+
+        try:
+            for page in range(self._max_pages):
+                response = request.get(self.URL.format(blogname=blogname), params)
+                notes = response.get('notes', [])
+                types.update(note['type'] for note in notes)
+
+                next_link = response.get('_links', {}).get('next', None)
+                if not notes or not next_link:
+                    break
+
+                truncated = page == self._max_pages - 1
+                params = dict(params, **next_link['query_params'])
+        except (requests.RequestException, RateLimitError):
+            return None
+
+        # Past the page cap the sampled notes' proportions are applied to the post's total
+        sampled = sum(types.values())
+        scale = note_count / sampled if truncated and sampled else 1
+
+        return tuple(round(types[note_type] * scale) for note_type in ('like', 'reblog', 'reply'))
+
+
+note_counts = NoteCountFetcher(
+    workers=int(os.getenv('TUMBLR_NOTES_WORKERS', 8)),
+    ttl=int(os.getenv('TUMBLR_NOTES_TTL', 10 * 60)),
+    max_size=int(os.getenv('TUMBLR_NOTES_CACHE_SIZE', 50000)),
+    max_pages=int(os.getenv('TUMBLR_NOTES_MAX_PAGES', 4))
+)
@@ -1,26 +1,41 @@
-from models.database import Platform
+from .registry import PlatformAttribute
 from models.post import *
 from models import Profile, PostView, UserMention
 from .platform import PlatformAPI
+from .rate_limit import RateLimiter, token_key
+from .twitter_comments import comment_counts
 from requests_oauthlib import OAuth1Session
+import utils.http
 from datetime import datetime, date
-from bs4 import BeautifulSoup
-import requests
 import re
 import twitter
-import os
-from uuid import uuid1
+
+
+def _parse_rate_limit_headers(response):
+    if 'x-rate-limit-remaining' not in response.headers:
+        return []
+
+    return [('token', None, int(response.headers['x-rate-limit-limit']),
+             int(response.headers['x-rate-limit-remaining']), float(response.headers['x-rate-limit-reset']))]
+
+
+def _snowflake_id(timestamp):
+    # Smallest tweet id that could have been created at the given unix timestamp
+    return (int(timestamp * 1000) - 1288834974657) << 22
 
 
 class TwitterAPI(PlatformAPI, twitter.Api):
-    PLATFORM = Platform.query.filter_by(name='TWITTER').one()
-    CLIENT_KEY = PLATFORM.client_key
-    CLIENT_SECRET = PLATFORM.client_secret
+    PLATFORM = PlatformAttribute('TWITTER')
+    CLIENT_KEY = PlatformAttribute('TWITTER', 'client_key')
+    CLIENT_SECRET = PlatformAttribute('TWITTER', 'client_secret')
+
+    RATE_LIMITER = RateLimiter('TWITTER', token_limit=(900, 15 * 60), app_limits={'daily': (100000, 24 * 60 * 60)},
+                               parse_headers=_parse_rate_limit_headers, per_resource=True)
 
     @staticmethod
     def generate_auth_req_token():
         # Step 1
-        oauth_session = OAuth1Session(TwitterAPI.CLIENT_KEY, TwitterAPI.CLIENT_SECRET)
+        oauth_session = utils.http.mount(OAuth1Session(TwitterAPI.CLIENT_KEY, TwitterAPI.CLIENT_SECRET))
         tokens = oauth_session.fetch_request_token('https://api.twitter.com/oauth/request_token')
         return tokens['oauth_token'], tokens['oauth_token_secret']
 
@@ -32,24 +47,33 @@ class TwitterAPI(PlatformAPI, twitter.Api):
     @staticmethod
     def generate_auth_token(request_token, request_token_secret, verifier):
         # Step 3
-        oauth = OAuth1Session(TwitterAPI.CLIENT_KEY,
-                              TwitterAPI.CLIENT_SECRET,
-                              request_token,
-                              request_token_secret,
-                              verifier=verifier)
+        oauth = utils.http.mount(OAuth1Session(TwitterAPI.CLIENT_KEY,
+                                               TwitterAPI.CLIENT_SECRET,
+                                               request_token,
+                                               request_token_secret,
+                                               verifier=verifier))
 
         tokens = oauth.fetch_access_token('https://api.twitter.com/oauth/access_token')
         return tokens['oauth_token'], tokens['oauth_token_secret']
 
-    def __init__(self, oauth_token, oauth_token_secret):
+    def __init__(self, oauth_token, oauth_token_secret, fetch_comment_counts=True):
         twitter.Api.__init__(self, self.CLIENT_KEY,
                              self.CLIENT_SECRET,
                              oauth_token,
                              oauth_token_secret,
                              tweet_mode='extended')
+        utils.http.mount(self._session)
+        self._token_key = token_key(oauth_token, oauth_token_secret)
+        self._fetch_comment_counts = fetch_comment_counts
+        self._user_id = None
+
+    def _RequestUrl(self, url, verb, data=None, json=None, enforce_auth=True):
+        return self.RATE_LIMITER.call(self._token_key, url, lambda: twitter.Api._RequestUrl(
+            self, url, verb, data=data, json=json, enforce_auth=enforce_auth))
 
     def get_profile(self):
         profile = self.VerifyCredentials().AsDict()
+        self._user_id = profile['id']
 
         profile_id = profile['screen_name']
         followers = profile.get('followers_count', 0)
@@ -63,7 +87,7 @@ class TwitterAPI(PlatformAPI, twitter.Api):
         return Profile(profile, profile_id, followers, name=name, bio=bio, profile_picture=profile_picture).as_dict()
 
     def get_post(self, post_id):
-        return self._get_post_view(self.GetStatus(post_id).AsDict())
+        return self._get_post_views([self.GetStatus(post_id).AsDict()])[0]
 
     def delete_post(self, post_id):
         self.DestroyStatus(post_id)
@@ -72,11 +96,10 @@ class TwitterAPI(PlatformAPI, twitter.Api):
         posts = []
         max_id = None
         out_of_week = False
-        user_id = self.VerifyCredentials().AsDict()['id']
+        user_id = self._get_user_id()
 
         while not out_of_week:
-            user_timeline_posts = [self._get_post_view(post.AsDict()) for post in
-                                   self.GetUserTimeline(user_id, count=200, max_id=max_id)]
+            user_timeline_posts = [post.AsDict() for post in self.GetUserTimeline(user_id, count=200, max_id=max_id)]
             if len(user_timeline_posts) == 0:
                 break
 
@@ -84,7 +107,7 @@ class TwitterAPI(PlatformAPI, twitter.Api):
 
             for i in range(len(user_timeline_posts)):
                 post = user_timeline_posts[i]
-                post_date_time = datetime.fromtimestamp(post['created_at'])
+                post_date_time = datetime.fromtimestamp(self._get_timestamp(post))
 
                 if today_week_no != post_date_time.isocalendar()[1]:
                     out_of_week = True
@@ -93,36 +116,67 @@ class TwitterAPI(PlatformAPI, twitter.Api):
                 posts.append(post)
 
             if len(posts) > 0:
-                max_id = int(posts[-1]['id']) - 1
+                max_id = int(posts[-1]['id_str']) - 1
+
+        return {'posts': self._get_post_views(posts)}
+
+    def get_posts_since(self, high_water, refresh_after):
+        since_id = _snowflake_id(refresh_after)
+        if high_water:
+            since_id = min(since_id, int(high_water))
+
+        posts = []
+        max_id = None
+        user_id = self._get_user_id()
+
+        while True:
+            user_timeline_posts = self.GetUserTimeline(user_id, count=200, since_id=since_id, max_id=max_id)
+            if len(user_timeline_posts) == 0:
+                break
+
+            posts.extend(post.AsDict() for post in user_timeline_posts)
+            max_id = user_timeline_posts[-1].id - 1
+
+        posts = self._get_post_views(posts)
+        if posts:
+            high_water = max(int(post['id']) for post in posts)
 
-        return {'posts': posts}
+        return posts, high_water and str(high_water)
 
     def post(self, post_draft):
-        # Dirty fix because python-twitter is a dull library
-        for file in post_draft.files:
-            file.mode = 'rb'
-
-        if len(post_draft.files) == 1 and post_draft.files[0].content_type in ('video/mp4', 'video/quicktime'):
-            file_path = os.path.join(os.getenv('TMP_FOLDER'),
-                                     f"{str(uuid1())}_{post_draft.files[0].filename}")
-            post_draft.files[0].save(file_path)
-            self.PostUpdate(status=post_draft.text, media=[file_path] + post_draft.files_url)
-            os.remove(file_path)
-        else:
-            self.PostUpdate(status=post_draft.text, media=(post_draft.files + post_draft.files_url))
+        # python-twitter wants 'rb' file objects named after the media type, readers stream straight from the draft
+        self.PostUpdate(status=post_draft.text, media=[media.open() for media in post_draft.media])
+
+    def _get_user_id(self):
+        if self._user_id is None:
+            self._user_id = self.VerifyCredentials().AsDict()['id']
+        return self._user_id
+
+    def _get_post_views(self, posts):
+        counts = {}
+
+        if self._fetch_comment_counts:
+            targets = {}
+            for post in posts:
+                while post:
+                    targets[post['id_str']] = post['user']['screen_name']
+                    post = post.get('quoted_status', None)
+
+            counts = comment_counts.fetch(targets)
+
+        return [self._get_post_view(post, counts) for post in posts]
+
+    @staticmethod
+    def _get_timestamp(post):
+        return datetime.strptime(post['created_at'], '%a %b %d %H:%M:%S %z %Y').timestamp()
 
     @staticmethod
-    def _get_post_view(post):
+    def _get_post_view(post, comment_counts):
         post_id = post['id_str']
-        timestamp = datetime.strptime(post['created_at'], '%a %b %d %H:%M:%S %z %Y').timestamp()
+        timestamp = TwitterAPI._get_timestamp(post)
         likes = post.get('favorite_count', 0)
         shares = post.get('retweet_count', 0)
-
-        screen_name = post['user']['screen_name']
-        html = requests.get(f'https://twitter.com/{screen_name}/status/{post_id}')
-        soup = BeautifulSoup(html.text, 'lxml')
-        comments = soup.find_all('span', attrs={'class': 'ProfileTweet-actionCountForAria'})[0].contents[0].split()[0]
-        comments_count = int(comments)
+        comments_count = comment_counts.get(post_id, 0)
 
         text = post.get('full_text', '')
         urls = post['urls']
@@ -149,8 +203,7 @@ class TwitterAPI(PlatformAPI, twitter.Api):
                     ))
 
         if 'quoted_status' in post:
-            embeds.append(QuoteEmbed(TwitterAPI._get_post_view(post['quoted_status'])))
+            embeds.append(QuoteEmbed(TwitterAPI._get_post_view(post['quoted_status'], comment_counts)))
 
         return PostView(post, post_id, timestamp, likes, shares, comments_count, text=text, hashtags=hashtags,
                         mentions=mentions, embeds=embeds).as_dict()
-
@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+from utils.cache import TTLCache
+import requests
+import utils.http
+import re
+import os
+
+
+class CommentCountFetcher:
+    # The reply count isn't part of the v1.1 API, it is only rendered on the tweet's page
+    URL = 'https://twitter.com/{screen_name}/status/{post_id}'
+    COUNT_REGEX = re.compile(rb'class="ProfileTweet-actionCountForAria"[^>]*>\s*([\d,]+)\s')
+
+    def __init__(self, workers, ttl, max_size, timeout=10):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='twitter-comments')
+        self._cache = TTLCache(max_size, ttl)
+        self._timeout = timeout
+
+    # Maps {post_id: screen_name} to {post_id: comments count} for every post whose count could be resolved
+    def fetch(self, posts):
+        counts = {}
+        missing = []
+
+        for post_id, screen_name in posts.items():
+            count = self._cache.get(post_id)
+            if count is None:
+                missing.append((post_id, screen_name))
+            else:
+                counts[post_id] = count
+
+        results = utils.http.map_within_deadline(self._executor, self._fetch_one, missing)
+        for (post_id, _), count in zip(missing, results):
+            if count is not None:
+                self._cache.set(post_id, count)
+                counts[post_id] = count
+
+        return counts
+
+    def _fetch_one(self, post):
+        post_id, screen_name = post
+
+        try:
+            with utils.http.session.get(self.URL.format(screen_name=screen_name, post_id=post_id), stream=True,
+                                   timeout=self._timeout) as response:
+                # The reply counter sits near the top of the page, so the download stops as soon as it is found
+                buffer = b''
+                for chunk in response.iter_content(chunk_size=16 * 1024):
+                    buffer += chunk
+                    match = self.COUNT_REGEX.search(buffer)
+                    if match:
+                        return int(match.group(1).replace(b',', b''))
+                    buffer = buffer[-512:]
+        except requests.RequestException:
+            pass
+
+        return None
+
+
+comment_counts = CommentCountFetcher(
+    workers=int(os.getenv('TWITTER_COMMENTS_WORKERS', 16)),
+    ttl=int(os.getenv('TWITTER_COMMENTS_TTL', 10 * 60)),
+    max_size=int(os.getenv('TWITTER_COMMENTS_CACHE_SIZE', 50000))
+)
@@ -1,6 +1,7 @@
 from flask_login import UserMixin
-from sqlalchemy import Index
+from sqlalchemy import Index, UniqueConstraint
 from app import db
+from datetime import datetime
 
 
 class User(db.Model, UserMixin):
@@ -18,6 +19,7 @@ class User(db.Model, UserMixin):
     linkedin_token = db.relationship('LinkedInToken', backref='user', lazy=True, uselist=False)
     tumblr_token = db.relationship('TumblrToken', backref='user', lazy=True, uselist=False)
     twitter_token = db.relationship('TwitterToken', backref='user', lazy=True, uselist=False)
+    default_pages = db.relationship('DefaultPage', lazy=True)
 
     def __init__(self, email, password, name):
         self.email = email
@@ -28,6 +30,12 @@ class User(db.Model, UserMixin):
     def is_active(self):
         return self.email_validated
 
+    def default_page(self, platform_id):
+        for default_page in self.default_pages:
+            if default_page.platform_id == platform_id:
+                return default_page.page_id
+        return None
+
 
 class LinkedInToken(db.Model):
     __tablename__ = 'linkedin_token'
@@ -113,6 +121,10 @@ class FollowersCount(db.Model):
         }
 
 
+# Stats columns in constructor order, shared by the snapshot, the rollups and the timelines
+STATS_FIELDS = ['comments_avg', 'comments_sum', 'likes_avg', 'likes_sum', 'shares_avg', 'shares_sum']
+
+
 class Stats(db.Model):
     __tablename__ = 'stats'
 
@@ -160,6 +172,68 @@ class Stats(db.Model):
         }
 
 
+class FollowersRollup(db.Model):
+    __tablename__ = 'followers_rollup'
+
+    id = db.Column(db.Integer, nullable=False, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    platform_id = db.Column(db.Integer, db.ForeignKey('platform.id'), nullable=False)
+    period = db.Column(db.String(5), nullable=False)
+    period_start = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+
+    followers_min = db.Column(db.Integer, nullable=False)
+    followers_max = db.Column(db.Integer, nullable=False)
+    followers_last = db.Column(db.Integer, nullable=False)
+    followers_total = db.Column(db.BigInteger, nullable=False)
+
+    __table_args__ = (UniqueConstraint('user_id', 'platform_id', 'period', 'period_start',
+                                       name='uq_followers_rollup_user_id_platform_id_period_period_start'),)
+
+
+class StatsRollup(db.Model):
+    __tablename__ = 'stats_rollup'
+
+    id = db.Column(db.Integer, nullable=False, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    platform_id = db.Column(db.Integer, db.ForeignKey('platform.id'), nullable=False)
+    period = db.Column(db.String(5), nullable=False)
+    period_start = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+
+    comments_avg_min = db.Column(db.Float, nullable=False)
+    comments_avg_max = db.Column(db.Float, nullable=False)
+    comments_avg_last = db.Column(db.Float, nullable=False)
+    comments_avg_total = db.Column(db.Float, nullable=False)
+    comments_sum_min = db.Column(db.Integer, nullable=False)
+    comments_sum_max = db.Column(db.Integer, nullable=False)
+    comments_sum_last = db.Column(db.Integer, nullable=False)
+    comments_sum_total = db.Column(db.BigInteger, nullable=False)
+
+    likes_avg_min = db.Column(db.Float, nullable=False)
+    likes_avg_max = db.Column(db.Float, nullable=False)
+    likes_avg_last = db.Column(db.Float, nullable=False)
+    likes_avg_total = db.Column(db.Float, nullable=False)
+    likes_sum_min = db.Column(db.Integer, nullable=False)
+    likes_sum_max = db.Column(db.Integer, nullable=False)
+    likes_sum_last = db.Column(db.Integer, nullable=False)
+    likes_sum_total = db.Column(db.BigInteger, nullable=False)
+
+    shares_avg_min = db.Column(db.Float, nullable=False)
+    shares_avg_max = db.Column(db.Float, nullable=False)
+    shares_avg_last = db.Column(db.Float, nullable=False)
+    shares_avg_total = db.Column(db.Float, nullable=False)
+    shares_sum_min = db.Column(db.Integer, nullable=False)
+    shares_sum_max = db.Column(db.Integer, nullable=False)
+    shares_sum_last = db.Column(db.Integer, nullable=False)
+    shares_sum_total = db.Column(db.BigInteger, nullable=False)
+
+    __table_args__ = (UniqueConstraint('user_id', 'platform_id', 'period', 'period_start',
+                                       name='uq_stats_rollup_user_id_platform_id_period_period_start'),)
+
+
 class DefaultPage(db.Model):
     __tablename__ = 'default_pages'
 
@@ -174,3 +248,114 @@ class DefaultPage(db.Model):
         self.user_id = user_id
         self.platform_id = platform_id
         self.page_id = page_id
+
+
+class Post(db.Model):
+    __tablename__ = 'post'
+
+    id = db.Column(db.Integer, nullable=False, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    platform_id = db.Column(db.Integer, db.ForeignKey('platform.id'), nullable=False)
+    page_id = db.Column(db.String(100), nullable=False, default='')
+    post_id = db.Column(db.String(100), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now(), nullable=False)
+
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    shares = db.Column(db.Integer, nullable=False, default=0)
+    comments_count = db.Column(db.Integer, nullable=False, default=0)
+
+    text = db.Column(db.Text)
+    hashtags = db.Column(db.ARRAY(db.String(200)))
+
+    # The PostView dict as served by the API, embeds and mentions included
+    view = db.Column(db.JSON, nullable=False)
+
+    __table_args__ = (Index('ix_post_user_id_platform_id_timestamp', 'user_id', 'platform_id', 'timestamp'),
+                      UniqueConstraint('user_id', 'platform_id', 'post_id', name='uq_post_user_id_platform_id_post_id'))
+
+    def __init__(self, user_id, platform_id, page_id, view):
+        self.user_id = user_id
+        self.platform_id = platform_id
+        self.page_id = page_id
+        self.update(view)
+
+    def update(self, view):
+        for column, value in self.columns(view).items():
+            setattr(self, column, value)
+
+    @staticmethod
+    def columns(view):
+        return {
+            'post_id': view['id'],
+            'timestamp': datetime.fromtimestamp(view['created_at']),
+            'likes': view['likes'],
+            'shares': view['shares'],
+            'comments_count': view['comments_count'],
+            'text': view.get('text', None),
+            'hashtags': view.get('hashtags', None),
+            'view': view
+        }
+
+
+class PostSync(db.Model):
+    __tablename__ = 'post_sync'
+
+    id = db.Column(db.Integer, nullable=False, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    platform_id = db.Column(db.Integer, db.ForeignKey('platform.id'), nullable=False)
+    page_id = db.Column(db.String(100), nullable=False, default='')
+
+    # Platform specific position of the newest stored post (Twitter since_id, Tumblr/LinkedIn creation time)
+    high_water = db.Column(db.String(100))
+    synced_at = db.Column(db.DateTime)
+
+    __table_args__ = (UniqueConstraint('user_id', 'platform_id', 'page_id',
+                                       name='uq_post_sync_user_id_platform_id_page_id'),)
+
+    def __init__(self, user_id, platform_id, page_id):
+        self.user_id = user_id
+        self.platform_id = platform_id
+        self.page_id = page_id
+
+
+class Job(db.Model):
+    __tablename__ = 'job'
+
+    id = db.Column(db.Integer, nullable=False, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+
+    # queued -> running -> done, or back to queued until the attempts run out and then failed
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+
+    run_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    locked_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    finished_at = db.Column(db.DateTime)
+
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+
+    __table_args__ = (Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+    def __init__(self, kind, payload, user_id=None, max_attempts=3):
+        self.kind = kind
+        self.payload = payload
+        self.user_id = user_id
+        self.max_attempts = max_attempts
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'created_at': self.created_at.timestamp() if self.created_at else None,
+            'finished_at': self.finished_at.timestamp() if self.finished_at else None,
+            'result': self.result,
+            'error': self.error
+        }
@@ -0,0 +1,133 @@
+from models.database import Job, User, FollowersCount
+from models.api.store import PostStore
+from models import PostDraft
+import models.rollup as rollup
+import utils.auth as auth
+from app import app, db
+from datetime import timedelta
+from time import monotonic, sleep
+import os
+
+# A job still running after this long belongs to a worker that died, it is handed out again
+LOCK_TIMEOUT = timedelta(seconds=int(os.getenv('JOB_LOCK_TIMEOUT', 15 * 60)))
+
+# Delay before a failed job is retried, multiplied by the number of attempts so far
+RETRY_DELAY = timedelta(seconds=int(os.getenv('JOB_RETRY_DELAY', 60)))
+
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+
+# Job kind -> function taking the job and returning its JSON result
+HANDLERS = {}
+
+
+def handler(kind):
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+
+    return decorator
+
+
+def enqueue(kind, payload, user_id=None, max_attempts=3):
+    # Added to the caller's transaction, workers only see the job once it commits
+    job = Job(kind, payload, user_id=user_id, max_attempts=max_attempts)
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+
+def enqueue_followers_snapshot(client, user_id):
+    return enqueue('followers_snapshot', {'platform': client.PLATFORM.name, 'page': client.page_id or None},
+                   user_id=user_id)
+
+
+def claim():
+    # SKIP LOCKED lets any number of workers poll the table without ever handing out the same job twice
+    job = Job.query.filter(Job.status == 'queued', Job.run_at <= db.func.now()) \
+        .order_by(Job.run_at).with_for_update(skip_locked=True).first()
+
+    if job:
+        job.status = 'running'
+        job.attempts += 1
+        job.locked_at = db.func.now()
+
+    db.session.commit()
+    return job
+
+
+def run(job):
+    job_id, kind = job.id, job.kind
+
+    try:
+        result = HANDLERS[kind](job)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f'Job {job_id} ({kind}) failed: {e!r}')
+
+        job.error = repr(e)
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = db.func.now() + RETRY_DELAY * job.attempts
+        else:
+            job.status = 'failed'
+            job.finished_at = db.func.now()
+    else:
+        job.status = 'done'
+        job.result = result
+        job.finished_at = db.func.now()
+
+    job.locked_at = None
+    db.session.commit()
+
+
+def requeue_stale():
+    stale = Job.query.filter(Job.status == 'running', Job.locked_at < db.func.now() - LOCK_TIMEOUT)
+
+    stale.filter(Job.attempts < Job.max_attempts) \
+        .update({'status': 'queued', 'locked_at': None}, synchronize_session=False)
+    stale.update({'status': 'failed', 'locked_at': None, 'finished_at': db.func.now(),
+                  'error': 'Worker lost while running the job.'}, synchronize_session=False)
+    db.session.commit()
+
+
+def work():
+    last_requeue = None
+
+    while True:
+        if last_requeue is None or monotonic() - last_requeue > LOCK_TIMEOUT.total_seconds() / 2:
+            requeue_stale()
+            last_requeue = monotonic()
+
+        job = claim()
+        if job:
+            run(job)
+        else:
+            sleep(POLL_INTERVAL)
+
+
+@handler('publish')
+def publish(job):
+    user = User.query.get(job.user_id)
+    client = auth.get_client(user, job.payload['platform'], job.payload['page'])
+
+    # files_url media is fetched here rather than in the request
+    post_draft = PostDraft.from_dict(job.payload['draft'])
+    try:
+        client.post(post_draft)
+    finally:
+        post_draft.close()
+
+    PostStore(client, user.id).expire()
+    enqueue_followers_snapshot(client, user.id)
+    return {'message': 'Posted successfully.'}
+
+
+@handler('followers_snapshot')
+def followers_snapshot(job):
+    user = User.query.get(job.user_id)
+    client = auth.get_client(user, job.payload['platform'], job.payload['page'])
+
+    followers_row = FollowersCount(user.id, client.PLATFORM.id, client.get_profile()['followers'], False)
+    db.session.add(followers_row)
+    rollup.record_followers(followers_row)
+    return {'followers': followers_row.followers}
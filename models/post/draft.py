@@ -1,9 +1,26 @@
+from utils.media import Media
+
+
 class PostDraft:
 
     def __init__(self, request):
         self.__text = request.form.get('text', '')
         self.__files = request.files.getlist('files[]', None)
         self.__files_url = request.form.getlist('files_url[]', None)
+        self.__media = None
+
+    @classmethod
+    def from_dict(cls, draft):
+        # Drafts published in the background, uploaded files can't travel in a job so only files_url media is kept
+        post_draft = cls.__new__(cls)
+        post_draft.__text = draft['text']
+        post_draft.__files = []
+        post_draft.__files_url = draft['files_url']
+        post_draft.__media = None
+        return post_draft
+
+    def as_dict(self):
+        return {'text': self.__text, 'files_url': self.__files_url}
 
     @property
     def text(self):
@@ -16,3 +33,15 @@ class PostDraft:
     @property
     def files_url(self):
         return self.__files_url
+
+    @property
+    def media(self):
+        # Uploads and files_url downloads alike, read once and shared by every platform the draft is posted to
+        if self.__media is None:
+            self.__media = [Media.from_upload(file) for file in self.__files] + \
+                           [Media.from_url(url) for url in self.__files_url]
+        return self.__media
+
+    def close(self):
+        for media in self.__media or []:
+            media.close()
@@ -0,0 +1,79 @@
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects.postgresql import insert, array_agg, aggregate_order_by
+from models.database import FollowersCount, Stats, FollowersRollup, StatsRollup, STATS_FIELDS
+from app import db
+
+PERIODS = ('day', 'week')
+
+
+# Raw rows are timestamped by the database with now(), which is constant within a transaction, so the rollups
+# are bucketed on the same clock as long as they are recorded before the raw row is committed
+
+def record_followers(followers_row):
+    _upsert(FollowersRollup, followers_row.user_id, followers_row.platform_id,
+            {'followers': followers_row.followers})
+
+
+def record_stats(stats_row):
+    _upsert(StatsRollup, stats_row.user_id, stats_row.platform_id,
+            {field: getattr(stats_row, field) for field in STATS_FIELDS})
+
+
+def rebuild():
+    # Recomputes every rollup from the raw history, for backfills and repairs
+    FollowersRollup.query.delete()
+    StatsRollup.query.delete()
+
+    for period in PERIODS:
+        _rebuild(FollowersRollup, FollowersCount, period, ['followers'])
+        _rebuild(StatsRollup, Stats, period, STATS_FIELDS)
+
+    db.session.commit()
+
+
+def _upsert(rollup_cls, user_id, platform_id, values):
+    table = rollup_cls.__table__
+
+    for period in PERIODS:
+        row = {
+            'user_id': user_id,
+            'platform_id': platform_id,
+            'period': period,
+            'period_start': func.date_trunc(period, func.now()),
+            'last_timestamp': func.now(),
+            'count': 1
+        }
+        for field, value in values.items():
+            row.update({f'{field}_min': value, f'{field}_max': value, f'{field}_last': value, f'{field}_total': value})
+
+        statement = insert(table).values(**row)
+        excluded = statement.excluded
+
+        update = {'last_timestamp': excluded.last_timestamp, 'count': table.c.count + 1}
+        for field in values:
+            update.update({
+                f'{field}_min': func.least(table.c[f'{field}_min'], excluded[f'{field}_min']),
+                f'{field}_max': func.greatest(table.c[f'{field}_max'], excluded[f'{field}_max']),
+                f'{field}_last': excluded[f'{field}_last'],
+                f'{field}_total': table.c[f'{field}_total'] + excluded[f'{field}_total']
+            })
+
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['user_id', 'platform_id', 'period', 'period_start'], set_=update))
+
+
+def _rebuild(rollup_cls, raw_cls, period, fields):
+    period_start = func.date_trunc(period, raw_cls.timestamp)
+
+    columns = [raw_cls.user_id, raw_cls.platform_id, literal(period), period_start, func.max(raw_cls.timestamp),
+               func.count()]
+    names = ['user_id', 'platform_id', 'period', 'period_start', 'last_timestamp', 'count']
+
+    for field in fields:
+        column = getattr(raw_cls, field)
+        columns.extend([func.min(column), func.max(column),
+                        array_agg(aggregate_order_by(column, raw_cls.timestamp.desc()))[1], func.sum(column)])
+        names.extend([f'{field}_min', f'{field}_max', f'{field}_last', f'{field}_total'])
+
+    query = select(columns).group_by(raw_cls.user_id, raw_cls.platform_id, period_start)
+    db.session.execute(insert(rollup_cls.__table__).from_select(names, query))
@@ -0,0 +1,264 @@
+from sqlalchemy import func, or_, and_, tuple_
+from sqlalchemy.dialects.postgresql import array_agg, aggregate_order_by
+from models.database import FollowersCount, Stats, FollowersRollup, StatsRollup, STATS_FIELDS
+from app import db
+from datetime import datetime, timedelta
+import json
+
+BUCKETS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'month': timedelta(days=31)
+}
+
+# Rollup read for each bucket, months are made of whole days but not of whole weeks
+BUCKET_SOURCES = {
+    'hour': None,
+    'day': 'day',
+    'week': 'week',
+    'month': 'day'
+}
+
+MAX_POINTS = 1000
+
+FOLLOWERS_FIELDS = ['followers', 'automatic']
+
+PAGE_SIZE = 500
+
+MAX_PAGE_SIZE = 5000
+
+STREAM_BATCH_SIZE = 1000
+
+
+def pick_bucket(date_begin, date_end, bucket=None, max_points=None):
+    # The finest bucket that still fits the requested number of points. A requested bucket is only ever made coarser,
+    # the range is never cut short to fit.
+    buckets = list(BUCKETS)
+    if bucket:
+        if bucket not in BUCKETS:
+            raise KeyError(f"Bucket must be one of {', '.join(BUCKETS)}.")
+        buckets = buckets[buckets.index(bucket):]
+
+    for bucket in buckets:
+        if _bucket_count(date_begin, date_end, bucket) <= max_points:
+            return bucket
+
+    raise KeyError(f'The date range spans more than {max_points} months, ask for more points or a shorter range.')
+
+
+def followers_timeline(user_id, platform_id, date_begin, date_end, bucket, max_points):
+    rows = _bucketed(FollowersCount, FollowersRollup, ['followers'], user_id, platform_id, date_begin, date_end,
+                     bucket, max_points)
+
+    return [{
+        'timestamp': timestamp.timestamp(),
+        'followers': last,
+        'followers_min': minimum,
+        'followers_max': maximum,
+        'followers_avg': float(average),
+        'count': count
+    } for timestamp, count, last, minimum, maximum, average in rows]
+
+
+def stats_timeline(user_id, platform_id, date_begin, date_end, bucket, max_points):
+    rows = _bucketed(Stats, StatsRollup, STATS_FIELDS, user_id, platform_id, date_begin, date_end, bucket, max_points)
+
+    entries = []
+    for timestamp, count, *values in rows:
+        # Last value of each field under its usual name, so bucketed entries read like raw ones
+        entry = {'timestamp': timestamp.timestamp(), 'count': count, 'min': {}, 'max': {}, 'avg': {}}
+
+        for i, field in enumerate(STATS_FIELDS):
+            last, minimum, maximum, average = values[i * 4:i * 4 + 4]
+            entry[field] = last
+            entry['min'][field] = minimum
+            entry['max'][field] = maximum
+            entry['avg'][field] = float(average)
+
+        entries.append(entry)
+
+    return entries
+
+
+def stats_summary(user_id, platform_id, date_begin, date_end):
+    # Sums and per snapshot averages of the engagement totals over a date range. Whole weeks and days are read from
+    # the rollups, only the partial days at the edges from the raw rows.
+    raw_ranges, rollup_ranges = _split(date_begin, date_end + timedelta(microseconds=1))
+    totals = {field: 0 for field in ('likes_sum', 'shares_sum', 'comments_sum')}
+    count = 0
+
+    if raw_ranges:
+        row = db.session.query(func.count(), *[func.coalesce(func.sum(getattr(Stats, field)), 0) for field in totals]) \
+            .filter(Stats.user_id == user_id, Stats.platform_id == platform_id) \
+            .filter(or_(*[and_(Stats.timestamp >= begin, Stats.timestamp < end) for begin, end in raw_ranges])) \
+            .one()
+        count += row[0]
+        for field, value in zip(totals, row[1:]):
+            totals[field] += value
+
+    if rollup_ranges:
+        row = db.session.query(func.coalesce(func.sum(StatsRollup.count), 0),
+                               *[func.coalesce(func.sum(getattr(StatsRollup, f'{field}_total')), 0)
+                                 for field in totals]) \
+            .filter(StatsRollup.user_id == user_id, StatsRollup.platform_id == platform_id) \
+            .filter(or_(*[and_(StatsRollup.period == period, StatsRollup.period_start >= begin,
+                               StatsRollup.period_start < end) for period, begin, end in rollup_ranges])) \
+            .one()
+        count += row[0]
+        for field, value in zip(totals, row[1:]):
+            totals[field] += value
+
+    stats = {field: int(total) for field, total in totals.items()}
+    stats.update({field.replace('_sum', '_avg'): float(total) / count if count else 0.0
+                  for field, total in totals.items()})
+
+    return stats
+
+
+def rows_page(raw_cls, fields, user_id, platform_id, date_begin, date_end, cursor=None, limit=PAGE_SIZE):
+    # One page of raw rows, newest first, and the cursor to the next one, None once the range is exhausted
+    query = _rows(raw_cls, fields, user_id, platform_id, date_begin, date_end, cursor)
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1])
+
+    return [_entry(fields, row) for row in rows], next_cursor
+
+
+def rows_all(raw_cls, fields, user_id, platform_id, date_begin, date_end):
+    return [_entry(fields, row) for row in _rows(raw_cls, fields, user_id, platform_id, date_begin, date_end)]
+
+
+def rows_json_stream(key, raw_cls, fields, user_id, platform_id, date_begin, date_end, cursor=None):
+    # Rows come off a server side cursor in batches and are written out as they arrive, the result set is never
+    # held in memory
+    query = _rows(raw_cls, fields, user_id, platform_id, date_begin, date_end, cursor) \
+        .execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
+
+    yield f'{{"{key}": ['
+    separator = ''
+    for row in query:
+        yield separator + json.dumps(_entry(fields, row))
+        separator = ','
+    yield ']}'
+
+
+def _rows(raw_cls, fields, user_id, platform_id, date_begin, date_end, cursor=None):
+    # Plain column tuples, (timestamp, id) keyset order walks the (user_id, platform_id, timestamp) index backwards
+    query = db.session.query(raw_cls.id, raw_cls.timestamp, *[getattr(raw_cls, field) for field in fields]).filter(
+        raw_cls.user_id == user_id,
+        raw_cls.platform_id == platform_id,
+        raw_cls.timestamp.between(date_begin, date_end)
+    )
+
+    if cursor:
+        timestamp, row_id = _decode_cursor(cursor)
+        query = query.filter(tuple_(raw_cls.timestamp, raw_cls.id) < tuple_(timestamp, row_id))
+
+    return query.order_by(raw_cls.timestamp.desc(), raw_cls.id.desc())
+
+
+def _entry(fields, row):
+    row_id, timestamp, *values = row
+    entry = {'timestamp': timestamp.timestamp()}
+    entry.update(zip(fields, values))
+    return entry
+
+
+def _encode_cursor(row):
+    return f'{row[1].isoformat()}_{row[0]}'
+
+
+def _decode_cursor(cursor):
+    try:
+        timestamp, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise KeyError('Invalid cursor.')
+
+
+def _bucketed(raw_cls, rollup_cls, fields, user_id, platform_id, date_begin, date_end, bucket, max_points):
+    source = BUCKET_SOURCES[bucket]
+    columns = []
+
+    if source is None:
+        period = func.date_trunc(bucket, raw_cls.timestamp).label('period')
+
+        for field in fields:
+            column = getattr(raw_cls, field)
+            columns.extend([array_agg(aggregate_order_by(column, raw_cls.timestamp.desc()))[1],
+                            func.min(column), func.max(column), func.avg(column)])
+
+        query = db.session.query(period, func.count(), *columns).filter(
+            raw_cls.user_id == user_id,
+            raw_cls.platform_id == platform_id,
+            raw_cls.timestamp.between(date_begin, date_end)
+        )
+    else:
+        period = func.date_trunc(bucket, rollup_cls.period_start).label('period')
+
+        for field in fields:
+            columns.extend([
+                array_agg(aggregate_order_by(getattr(rollup_cls, f'{field}_last'), rollup_cls.period_start.desc()))[1],
+                func.min(getattr(rollup_cls, f'{field}_min')),
+                func.max(getattr(rollup_cls, f'{field}_max')),
+                func.sum(getattr(rollup_cls, f'{field}_total')) / func.sum(rollup_cls.count)
+            ])
+
+        query = db.session.query(period, func.sum(rollup_cls.count), *columns).filter(
+            rollup_cls.user_id == user_id,
+            rollup_cls.platform_id == platform_id,
+            rollup_cls.period == source,
+            rollup_cls.period_start.between(_floor(date_begin, source), date_end)
+        )
+
+    return query.group_by(period).order_by(period.desc()).limit(max_points).all()
+
+
+def _split(date_begin, date_end):
+    # Covers [date_begin, date_end) with the coarsest periods that fit entirely inside it
+    raw_ranges = []
+    rollup_ranges = []
+
+    weeks_begin, weeks_end = _ceil(date_begin, 'week'), _floor(date_end, 'week')
+    if weeks_begin < weeks_end:
+        rollup_ranges.append(('week', weeks_begin, weeks_end))
+        edges = [(date_begin, weeks_begin), (weeks_end, date_end)]
+    else:
+        edges = [(date_begin, date_end)]
+
+    for begin, end in edges:
+        days_begin, days_end = _ceil(begin, 'day'), _floor(end, 'day')
+        if days_begin < days_end:
+            rollup_ranges.append(('day', days_begin, days_end))
+            raw_ranges.extend([(begin, days_begin), (days_end, end)])
+        elif begin < end:
+            raw_ranges.append((begin, end))
+
+    return [(begin, end) for begin, end in raw_ranges if begin < end], rollup_ranges
+
+
+def _bucket_count(date_begin, date_end, bucket):
+    # Number of date_trunc buckets the range touches, the partial ones at both edges included
+    if bucket == 'month':
+        return (date_end.year - date_begin.year) * 12 + date_end.month - date_begin.month + 1
+    if bucket == 'hour':
+        begin, end = (moment.replace(minute=0, second=0, microsecond=0) for moment in (date_begin, date_end))
+    else:
+        begin, end = _floor(date_begin, bucket), _floor(date_end, bucket)
+
+    return (end - begin) // BUCKETS[bucket] + 1
+
+
+def _floor(moment, period):
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(days=day.weekday()) if period == 'week' else day
+
+
+def _ceil(moment, period):
+    floor = _floor(moment, period)
+    return floor if floor == moment else floor + (BUCKETS['week'] if period == 'week' else BUCKETS['day'])
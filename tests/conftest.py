@@ -0,0 +1,6 @@
+import os
+
+# The app is configured from the environment when it is imported, tests only need it to import
+os.environ.setdefault('BASE_DOMAIN', 'http://localhost')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('FLASK_SECRET_KEY', 'test')
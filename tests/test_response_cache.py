@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+from itertools import count
+from flask import jsonify
+from app import app
+import views.platforms.cache as cache
+
+
+class FakePostStore:
+    # One shared store, synced once like a real one within its interval, its version being the sync number
+    syncs = count(1)
+    synced_at = None
+
+    def __init__(self, client, user_id):
+        pass
+
+    def sync(self, force=False):
+        if FakePostStore.synced_at is None or force:
+            FakePostStore.synced_at = next(FakePostStore.syncs)
+
+    def version(self):
+        return FakePostStore.synced_at
+
+
+def test_response_of_a_syncing_request_is_served_from_cache(monkeypatch):
+    monkeypatch.setattr(cache, 'PostStore', FakePostStore)
+    monkeypatch.setattr(cache.auth, 'get_authenticated_user', lambda: SimpleNamespace(id=1))
+    monkeypatch.setattr(FakePostStore, 'synced_at', None)
+
+    response_cache = cache.ResponseCache(max_size=16)
+    client = SimpleNamespace(PLATFORM=SimpleNamespace(name='TWITTER'), page_id=None)
+    calls = []
+
+    @response_cache.cached('posts', 60, synced=True)
+    def get_posts(client):
+        # Like PlatformView.get_posts, reads through the store which syncs when it is due
+        FakePostStore(client, 1).sync()
+        calls.append(FakePostStore.synced_at)
+        return jsonify(posts=[])
+
+    responses = []
+    for _ in range(2):
+        with app.test_request_context('/twitter/profile/posts'):
+            responses.append(get_posts(client))
+
+    assert [response.headers['X-Cache'] for response in responses] == ['MISS', 'HIT']
+    assert calls == [1]
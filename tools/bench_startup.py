@@ -0,0 +1,44 @@
+# Startup benchmark: import time of the web app, time to its first request and the deferred cost of each platform
+# client, every figure measured in a fresh interpreter. Run from the repository root with the app's environment set:
+#   python -m tools.bench_startup [runs]
+from statistics import median
+import subprocess
+import sys
+
+SNIPPETS = {
+    'import run': """
+start = perf_counter()
+import run
+result = perf_counter() - start
+""",
+    'first request': """
+import run
+client = run.app.test_client()
+start = perf_counter()
+client.get('/')
+result = perf_counter() - start
+""",
+    **{f'import {client}': f"""
+import run
+import models.api as api
+start = perf_counter()
+api.{client}
+result = perf_counter() - start
+""" for client in ('LinkedInAPI', 'TumblrAPI', 'TwitterAPI')}
+}
+
+
+def measure(snippet):
+    code = f'from time import perf_counter\n{snippet}\nprint(result)'
+    output = subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE, universal_newlines=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def main(runs):
+    for name, snippet in SNIPPETS.items():
+        timings = [measure(snippet) for _ in range(runs)]
+        print(f'{name:>22}: {median(timings) * 1e3:8.1f} ms median, {min(timings) * 1e3:8.1f} ms min')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -1,14 +1,81 @@
 from functools import wraps
-from flask import jsonify, request, session, redirect
+from flask import jsonify, request, session, redirect, g
 from flask_login import current_user
-from app import login_manager
-from models.api import *
-from models.database import User, DefaultPage
+from app import app, login_manager, db
+import models.api as api
+from models.api.pool import client_pool
+from models.database import User
+from sqlalchemy.orm import joinedload
+from utils.cache import TTLCache
+import utils.jwt
+import jwt.exceptions
+import os
+
+# Users with their platform tokens and default pages, detached from any session. Each process holds its own copy, so the short TTL
+# bounds how long another process's changes go unseen.
+USER_CACHE = TTLCache(max_size=int(os.getenv('USER_CACHE_SIZE', 1024)), ttl=int(os.getenv('USER_CACHE_TTL', 60)))
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return get_user(int(user_id))
+
+
+@login_manager.request_loader
+def load_user_from_request(request):
+    # Stateless alternative to the session cookie: Authorization: Bearer <token from /token>
+    authorization = request.headers.get('Authorization', '')
+    if not authorization.startswith('Bearer '):
+        return None
+
+    try:
+        claims = utils.jwt.decode_access_token(authorization[len('Bearer '):])
+    except jwt.exceptions.InvalidTokenError:
+        return None
+
+    if not claims.get('email_validated', False):
+        return None
+
+    # Like reset tokens, every token issued before the user row last changed (password reset, rehash) is revoked
+    user = get_user(claims['user_id'])
+    if user is None or user.updated_at.timestamp() > claims['iat']:
+        return None
+
+    return user
+
+
+def get_user(user_id):
+    # Memoized for the request, so that loaders, decorators and views all share one instance
+    users = g.setdefault('users', {})
+    if user_id not in users:
+        users[user_id] = _load_user(user_id)
+    return users[user_id]
+
+
+def _load_user(user_id):
+    cached = USER_CACHE.get(user_id)
+
+    if cached is None:
+        # Everything the platform decorators read in one joined query, detached and kept for the next requests
+        cached = User.query.options(joinedload(User.linkedin_token), joinedload(User.tumblr_token),
+                                    joinedload(User.twitter_token), joinedload(User.default_pages)).get(user_id)
+        if cached is None:
+            return None
+
+        instances = [cached.linkedin_token, cached.tumblr_token, cached.twitter_token, *cached.default_pages, cached]
+        for instance in instances:
+            if instance is not None:
+                db.session.expunge(instance)
+        USER_CACHE.set(user_id, cached)
+
+    # Attaches a copy to this request's session without querying, the cached instance itself is never modified
+    return db.session.merge(cached, load=False)
+
+
+def forget_user(user_id):
+    # Called wherever the user row, its tokens or its default pages change
+    USER_CACHE.pop(user_id)
+    g.pop('users', None)
 
 
 def get_authenticated_user():
@@ -45,6 +112,52 @@ def verified_user_required(func):
     return decorator
 
 
+def get_linkedin_client(user, company=None):
+    if not company:
+        company = user.default_page(api.LinkedInAPI.PLATFORM.id)
+
+    return client_pool.get(user.id, 'LINKEDIN', company, (user.linkedin_token.token,),
+                           lambda token: api.LinkedInAPI(token, company=company))
+
+
+def get_twitter_client(user):
+    return client_pool.get(user.id, 'TWITTER', None, (user.twitter_token.token, user.twitter_token.token_secret),
+                           lambda token, token_secret: api.TwitterAPI(token, token_secret))
+
+
+def get_tumblr_client(user, blogname=None):
+    return client_pool.get(user.id, 'TUMBLR', blogname, (user.tumblr_token.token, user.tumblr_token.token_secret),
+                           lambda token, token_secret: api.TumblrAPI(token, token_secret, blogname=blogname))
+
+
+# Platform name -> (User relationship holding its token, client getter taking the user and an optional page)
+PLATFORM_CLIENTS = {
+    'LINKEDIN': ('linkedin_token', get_linkedin_client),
+    'TUMBLR': ('tumblr_token', get_tumblr_client),
+    'TWITTER': ('twitter_token', lambda user, page=None: get_twitter_client(user))
+}
+
+
+def is_connected(user, platform_name):
+    token_attr, _ = PLATFORM_CLIENTS[platform_name]
+    return getattr(user, token_attr) is not None
+
+
+def get_client(user, platform_name, page=None):
+    _, get_platform_client = PLATFORM_CLIENTS[platform_name]
+    return get_platform_client(user, page)
+
+
+def call_in_app_context(func, *args, **kwargs):
+    # For work handed over to another thread. It gets an app context and a session of its own, so the user passed
+    # along has to be the object itself rather than current_user, with its tokens loaded (is_connected) beforehand.
+    with app.app_context():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            db.session.remove()
+
+
 def linkedin_required(func):
     @wraps(func)
     @verified_user_check
@@ -52,12 +165,7 @@ def linkedin_required(func):
         if not current_user.linkedin_token:
             return jsonify(error='Unauthenticated for LinkedIn.'), 401
 
-        company = request.args.get('page', None)
-        if not company:
-            default_page = DefaultPage.query.filter_by(user_id=current_user.id).first()
-            company = default_page.page_id if default_page else None
-
-        linkedin_client = LinkedInAPI(current_user.linkedin_token.token, company=company)
+        linkedin_client = get_linkedin_client(current_user, request.args.get('page', None))
         return func(linkedin_client, *args, **kwargs)
 
     return decorator
@@ -70,7 +178,7 @@ def twitter_required(func):
         if not current_user.twitter_token:
             return jsonify(error='Unauthenticated for Twitter.'), 401
 
-        twitter_client = TwitterAPI(current_user.twitter_token.token, current_user.twitter_token.token_secret)
+        twitter_client = get_twitter_client(current_user)
         return func(twitter_client, *args, **kwargs)
 
     return decorator
@@ -83,8 +191,7 @@ def tumblr_required(func):
         if not current_user.tumblr_token:
             return jsonify(error='Unauthenticated for Tumblr.'), 401
 
-        tumblr_client = TumblrAPI(current_user.tumblr_token.token, current_user.tumblr_token.token_secret,
-                                  blogname=request.args.get('page', None))
+        tumblr_client = get_tumblr_client(current_user, request.args.get('page', None))
         return func(tumblr_client, *args, **kwargs)
 
     return decorator
@@ -13,3 +13,12 @@ class FakeMail:
         print(f"{message.subject} Recipients: {' '.join(message.recipients)}")
         print(message)
         print('<EndMail>')
+
+    def connect(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
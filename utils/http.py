@@ -0,0 +1,132 @@
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import wait
+from contextlib import contextmanager
+from http.cookiejar import DefaultCookiePolicy
+from threading import local
+from time import monotonic
+import requests
+import os
+
+TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 30))
+
+_deadlines = local()
+
+
+@contextmanager
+def deadline(seconds):
+    # Every request the calling thread sends within the block has to be over by then, nested deadlines only shorten it
+    previous = getattr(_deadlines, 'at', None)
+    at = monotonic() + seconds
+    _deadlines.at = at if previous is None else min(previous, at)
+
+    try:
+        yield
+    finally:
+        _deadlines.at = previous
+
+
+def remaining_time():
+    at = getattr(_deadlines, 'at', None)
+    return None if at is None else at - monotonic()
+
+
+def with_deadline(func):
+    # Deadlines are per thread, work handed over to an executor is bound to the calling thread's one explicitly
+    remaining = remaining_time()
+    if remaining is None:
+        return func
+
+    at = monotonic() + remaining
+
+    def bound(*args, **kwargs):
+        with deadline(at - monotonic()):
+            return func(*args, **kwargs)
+
+    return bound
+
+
+def map_within_deadline(executor, func, items):
+    # executor.map on behalf of the calling thread. The tasks share its deadline, and once it has passed the results
+    # still missing come back as None and the tasks that haven't started are cancelled.
+    futures = [executor.submit(with_deadline(func), item) for item in items]
+    _, not_done = wait(futures, timeout=remaining_time())
+
+    for future in not_done:
+        future.cancel()
+
+    return [None if future in not_done else future.result() for future in futures]
+
+
+class _TimeoutAdapter(HTTPAdapter):
+    # Requests without a timeout of their own get the default one, cut down to what is left of the thread's deadline
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = TIMEOUT
+
+        remaining = remaining_time()
+        if remaining is not None:
+            if remaining <= 0:
+                raise requests.Timeout(f'Deadline exceeded before {request.method} {request.url}.', request=request)
+            if isinstance(timeout, tuple):
+                timeout = tuple(remaining if part is None else min(part, remaining) for part in timeout)
+            else:
+                timeout = min(timeout, remaining)
+
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+# One adapter holds the keep-alive connection pools for every outbound request of the process. OAuth sessions are
+# still created per client, they just mount this adapter instead of opening their own connections.
+adapter = _TimeoutAdapter(
+    pool_connections=int(os.getenv('HTTP_POOL_HOSTS', 16)),
+    pool_maxsize=int(os.getenv('HTTP_POOL_SIZE', 32)),
+    max_retries=Retry(
+        total=int(os.getenv('HTTP_RETRIES', 2)),
+        backoff_factor=float(os.getenv('HTTP_RETRY_BACKOFF', 0.3)),
+        # 429s are left to the rate limiters and non idempotent requests are never replayed
+        status_forcelist=(502, 503, 504),
+        method_whitelist=frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS']),
+        raise_on_status=False
+    )
+)
+
+
+def mount(session):
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+session = mount(requests.Session())
+
+# The session is shared by every user and also fetches URLs users supply, cookies set by one response must never be
+# sent along with another request
+session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+
+def stats():
+    hosts = {}
+    pools = adapter.poolmanager.pools
+
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+
+        hosts[f'{key.key_scheme}://{key.key_host}:{key.key_port}'] = {
+            'connections': pool.num_connections,
+            'requests': pool.num_requests,
+            'reused': pool.num_requests - pool.num_connections
+        }
+
+    connections = sum(host['connections'] for host in hosts.values())
+    requests_count = sum(host['requests'] for host in hosts.values())
+
+    return {
+        'hosts': hosts,
+        'connections': connections,
+        'requests': requests_count,
+        'reuse_ratio': (requests_count - connections) / requests_count if requests_count else 0
+    }
@@ -1,6 +1,10 @@
 from app import app
 from datetime import datetime
+from time import time
 import jwt
+import os
+
+ACCESS_TOKEN_TTL = int(os.getenv('ACCESS_TOKEN_TTL', 24 * 60 * 60))
 
 
 def encode(data):
@@ -29,4 +33,15 @@ def generate_reset_password_token(user):
 def generate_token(user):
     return encode({
         'user_id': user.id,
+        'email_validated': user.email_validated,
+        'request_type': 'access',
+        'exp': int(time()) + ACCESS_TOKEN_TTL
     })
+
+
+def decode_access_token(token):
+    # Raises jwt.exceptions.InvalidTokenError for bad signatures, expired tokens and other token types
+    data = jwt.decode(token.encode(), app.config['SECRET_KEY'], algorithms=['HS256'])
+    if data.get('request_type', None) != 'access':
+        raise jwt.exceptions.InvalidTokenError('Not an access token.')
+    return data
@@ -1,8 +1,131 @@
 from flask_mail import Message
+from collections import OrderedDict
+from queue import Queue, Empty
+from threading import Thread, Lock
+from time import monotonic
 from app import app, mail
+import atexit
 import os
 
 
+class MailSender:
+    # Mail is handed over to a background thread, which sends whatever has queued up over one SMTP connection.
+    # Error mails are gathered for a window and go out as a single digest counting identical errors.
+
+    def __init__(self, batch_size, digest_window):
+        self._batch_size = batch_size
+        self._digest_window = digest_window
+        self._queue = Queue()
+        self._errors = OrderedDict()
+        self._digest_due = None
+        self._lock = Lock()
+        self._thread = None
+        self._stopping = False
+
+    def send(self, message):
+        self._queue.put(message)
+        self._ensure_started()
+
+    def report_error(self, error):
+        with self._lock:
+            opens_window = not self._errors
+            if opens_window:
+                self._digest_due = monotonic() + self._digest_window
+            self._errors[error] = self._errors.get(error, 0) + 1
+
+        self._ensure_started()
+        if opens_window:
+            # Wakes the sender up so that it starts waiting on the digest's deadline
+            self._queue.put(None)
+
+    def flush(self, timeout):
+        # At exit: the sender delivers whatever is queued, the pending digest included, and stops. The daemon thread
+        # would otherwise be killed with the process and take its queue along.
+        self._stopping = True
+
+        with self._lock:
+            thread = self._thread
+
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+        else:
+            self._run()
+
+    def _ensure_started(self):
+        # Started on first use, so that every forked worker process gets a thread of its own
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name='mail-sender', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        with app.app_context():
+            while True:
+                batch = []
+
+                try:
+                    batch.append(self._queue.get(timeout=self._wait_time()))
+                    while len(batch) < self._batch_size:
+                        batch.append(self._queue.get_nowait())
+                except Empty:
+                    pass
+
+                batch = [message for message in batch if message is not None]
+                digest = self._take_digest()
+                if digest:
+                    batch.append(digest)
+
+                if batch:
+                    self._deliver(batch)
+
+                if self._stopping and self._queue.empty():
+                    return
+
+    def _wait_time(self):
+        if self._stopping:
+            return 0
+
+        with self._lock:
+            if self._digest_due is None:
+                return None
+            return max(self._digest_due - monotonic(), 0)
+
+    def _take_digest(self):
+        with self._lock:
+            if self._digest_due is None or (monotonic() < self._digest_due and not self._stopping):
+                return None
+
+            errors, self._errors, self._digest_due = self._errors, OrderedDict(), None
+
+        body = '\n\n'.join(f'[{count}x] {error}' if count > 1 else error for error, count in errors.items())
+        return Message(
+            f'[SMA] {sum(errors.values())} Undefined Error(s) Occurred!',
+            body=body,
+            recipients=[os.getenv('ADMIN_EMAIL')]
+        )
+
+    @staticmethod
+    def _deliver(messages):
+        try:
+            with mail.connect() as connection:
+                for message in messages:
+                    try:
+                        connection.send(message)
+                    except Exception as e:
+                        app.logger.error(f'Failed to send mail "{message.subject}": {e!r}')
+        except Exception as e:
+            app.logger.error(f'Failed to connect to the mail server, {len(messages)} mail(s) dropped: {e!r}')
+
+
+mail_sender = MailSender(
+    batch_size=int(os.getenv('MAIL_BATCH_SIZE', 50)),
+    digest_window=float(os.getenv('ERROR_MAIL_DIGEST_WINDOW', 60))
+)
+
+atexit.register(mail_sender.flush, float(os.getenv('MAIL_FLUSH_TIMEOUT', 10)))
+
+
 def send_validate_email(email, token):
     msg = Message(
         'Validate your email for your Social Media Aggregate account!',
@@ -10,7 +133,7 @@ def send_validate_email(email, token):
         recipients=[email]
     )
 
-    mail.send(msg)
+    mail_sender.send(msg)
 
 
 def send_reset_password_email(email, token):
@@ -20,17 +143,11 @@ def send_reset_password_email(email, token):
         recipients=[email]
     )
 
-    mail.send(msg)
+    mail_sender.send(msg)
 
 
 def send_internal_error_email(error):
     if not os.environ.get('ACTIVATE_ERROR_MAILS', False):
         return
 
-    msg = Message(
-        '[SMA] An Undefined Error Occurred!',
-        body=error,
-        recipients=[os.getenv('ADMIN_EMAIL')]
-    )
-
-    mail.send(msg)
+    mail_sender.report_error(error)
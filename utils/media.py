@@ -0,0 +1,99 @@
+from tempfile import SpooledTemporaryFile
+from threading import Lock
+from urllib.parse import urlparse
+import mimetypes
+import utils.http
+import io
+import os
+
+# Downloaded media stays in memory up to this size and spills to an anonymous temporary file past it, which the
+# operating system removes as soon as it is closed, even if posting fails halfway
+SPOOL_MAX_SIZE = int(os.getenv('MEDIA_SPOOL_MAX_SIZE', 8 * 1024 * 1024))
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Media:
+
+    def __init__(self, name, content_type, file):
+        self.content_type = content_type
+
+        # Platform libraries guess the media type from the file name
+        if mimetypes.guess_type(name)[0] is None:
+            name += mimetypes.guess_extension(content_type) or ''
+        self.name = name
+
+        self._file = file
+        self._lock = Lock()
+        file.seek(0, io.SEEK_END)
+        self.size = file.tell()
+
+    @classmethod
+    def from_upload(cls, file):
+        # Werkzeug already spooled the upload while parsing the form, its stream is used as is
+        return cls(file.filename or 'media', file.content_type or 'application/octet-stream', file.stream)
+
+    @classmethod
+    def from_url(cls, url):
+        spool = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, dir=os.getenv('TMP_FOLDER'))
+
+        with utils.http.session.get(url, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                spool.write(chunk)
+
+        content_type = response.headers.get('Content-Type', 'application/octet-stream').split(';')[0]
+        return cls(os.path.basename(urlparse(url).path) or 'media', content_type, spool)
+
+    @property
+    def kind(self):
+        return self.content_type.split('/')[0]
+
+    def open(self):
+        return MediaReader(self)
+
+    def as_upload(self):
+        return self.name, self.open(), self.content_type
+
+    def close(self):
+        self._file.close()
+
+    def _read_at(self, position, size):
+        with self._lock:
+            self._file.seek(position)
+            return self._file.read(size)
+
+
+class MediaReader(io.RawIOBase):
+    # Binary file object with its own position over a Media, so several uploads can stream the same media at once
+    mode = 'rb'
+
+    def __init__(self, media):
+        io.RawIOBase.__init__(self)
+        self.name = media.name
+        self._media = media
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._media._read_at(self._position, len(buffer))
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._media.size
+
+        self._position = offset
+        return self._position
+
+    def tell(self):
+        return self._position
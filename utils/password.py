@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import perf_counter
+import bcrypt
+import os
+
+MIN_ROUNDS = int(os.getenv('PASSWORD_MIN_ROUNDS', 10))
+MAX_ROUNDS = int(os.getenv('PASSWORD_MAX_ROUNDS', 15))
+
+# Time a single hash should take on this machine when the cost isn't set explicitly
+TARGET_TIME = float(os.getenv('PASSWORD_HASH_TARGET_MS', 250)) / 1e3
+
+# bcrypt releases the GIL, the pool bounds how many hashes run at once and everything else waits in its queue
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('PASSWORD_HASH_WORKERS', 2)), thread_name_prefix='password')
+_pending = 0
+_pending_lock = Lock()
+
+
+def calibrate(target_time, min_rounds, max_rounds):
+    # Every round doubles the cost, so timing the cheapest one is enough to find the highest cost within the target
+    start = perf_counter()
+    bcrypt.hashpw(b'calibration', bcrypt.gensalt(min_rounds))
+    elapsed = perf_counter() - start
+
+    rounds = min_rounds
+    while rounds < max_rounds and elapsed * 2 <= target_time:
+        rounds += 1
+        elapsed *= 2
+
+    return rounds
+
+
+ROUNDS = int(os.getenv('PASSWORD_ROUNDS', 0)) or calibrate(TARGET_TIME, MIN_ROUNDS, MAX_ROUNDS)
+
+
+def hash_password(password):
+    return _run(lambda: bcrypt.hashpw(password.encode(), bcrypt.gensalt(ROUNDS)).decode())
+
+
+def check_password(password, pwd_hash):
+    return _run(lambda: bcrypt.checkpw(password.encode(), pwd_hash.encode()))
+
+
+def needs_rehash(pwd_hash):
+    # Hashes look like $2b$<rounds>$<salt and digest>, only weaker ones than the current cost are upgraded
+    return int(pwd_hash.split('$')[2]) < ROUNDS
+
+
+def stats():
+    return {
+        'rounds': ROUNDS,
+        'workers': _executor._max_workers,
+        'queue_depth': _pending
+    }
+
+
+def _run(func):
+    global _pending
+
+    with _pending_lock:
+        _pending += 1
+
+    try:
+        return _executor.submit(func).result()
+    finally:
+        with _pending_lock:
+            _pending -= 1
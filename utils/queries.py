@@ -0,0 +1,14 @@
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Counts the statements sent by the request's own thread, work handed to executors runs in other contexts
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def count():
+    return g.get('query_count', 0)
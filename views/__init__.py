@@ -2,6 +2,9 @@ from .test import *
 from .errors import *
 from .platforms import *
 from .common import *
+from .dashboard import *
+from .crosspost import *
+from .jobs import *
 from .auth import auth
 from app import app
 
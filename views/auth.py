@@ -6,7 +6,7 @@ import utils.auth
 import utils.request
 import utils.mail
 import utils.jwt
-import bcrypt
+import utils.password
 import jwt
 import re
 
@@ -32,8 +32,7 @@ def signup():
     if user:
         return jsonify(error='There is already an account registered with this email.'), 409
 
-    salt = bcrypt.gensalt()
-    pwd_hash = bcrypt.hashpw(password.encode(), salt).decode()
+    pwd_hash = utils.password.hash_password(password)
 
     user = User(email, pwd_hash, name)
     db.session.add(user)
@@ -60,9 +59,15 @@ def login():
         if not user:
             return jsonify(error='Wrong email.'), 401
 
-        if not bcrypt.checkpw(password.encode(), user.password.encode()):
+        if not utils.password.check_password(password, user.password):
             return jsonify(error='Wrong password.'), 401
 
+        # The plain password is only ever at hand here, so hashes made at an older cost are upgraded on login
+        if utils.password.needs_rehash(user.password):
+            user.password = utils.password.hash_password(password)
+            db.session.commit()
+            utils.auth.forget_user(user.id)
+
         flask_login.login_user(user, force=True)
 
         return jsonify(message='Authentication succeeded.')
@@ -86,6 +91,7 @@ def validate_email():
     user = User.query.get(token['user_id'])
     user.email_validated = True
     db.session.commit()
+    utils.auth.forget_user(user.id)
 
     return jsonify(message='Email validated successfully.')
 
@@ -125,9 +131,8 @@ def reset_password_callback():
     if user.updated_at.timestamp() > int(token['iat']):
         return jsonify(message='Token expired.'), 403
 
-    salt = bcrypt.gensalt()
-    pwd_hash = bcrypt.hashpw(password.encode(), salt).decode()
-    user.password = pwd_hash
+    user.password = utils.password.hash_password(password)
     db.session.commit()
+    utils.auth.forget_user(user.id)
 
     return jsonify(message='Password reset succesfully.')
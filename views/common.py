@@ -2,6 +2,9 @@ from flask import jsonify
 from utils.auth import verified_user_required
 from app import app
 import utils.jwt
+import utils.http
+import utils.password
+import utils.queries
 
 
 @app.route('/profile')
@@ -14,3 +17,14 @@ def profile(user):
 @verified_user_required
 def token(user):
     return jsonify(token=utils.jwt.generate_token(user))
+
+
+@app.route('/health')
+def health():
+    return jsonify(http=utils.http.stats(), password_hashing=utils.password.stats())
+
+
+@app.after_request
+def query_count_header(response):
+    response.headers['X-Query-Count'] = str(utils.queries.count())
+    return response
@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import jsonify, request
+from models import PostDraft
+import models.jobs as jobs
+from utils.auth import verified_user_required, PLATFORM_CLIENTS, is_connected, get_client, call_in_app_context
+from .platforms.platform import PlatformView
+from app import app, db
+import os
+
+crosspost_executor = ThreadPoolExecutor(max_workers=int(os.getenv('CROSSPOST_WORKERS', 12)),
+                                        thread_name_prefix='crosspost')
+
+
+def _publish(user, platform_name, page, post_draft):
+    client = get_client(user, platform_name, page)
+    client.post(post_draft)
+    return client
+
+
+def _enqueue_crosspost(user, targets):
+    # One publishing job per platform, the response carries their ids to poll GET /jobs/<job_id> with
+    if request.files.getlist('files[]'):
+        return jsonify(error='Uploaded files can only be posted synchronously, use files_url[] instead.'), 400
+
+    draft = PostDraft(request).as_dict()
+    platforms = {}
+
+    for platform_name in dict.fromkeys(targets):
+        if not is_connected(user, platform_name.upper()):
+            platforms[platform_name] = {'status': 'not_connected'}
+            continue
+
+        job = jobs.enqueue('publish', {
+            'platform': platform_name.upper(),
+            'page': request.form.get(f'{platform_name}_page', None),
+            'draft': draft
+        }, user_id=user.id, max_attempts=1)
+        platforms[platform_name] = {'status': 'queued', 'job_id': job.id}
+
+    db.session.commit()
+    return jsonify(platforms=platforms), 202
+
+
+@app.route('/post', methods=['POST'])
+@verified_user_required
+def crosspost(user):
+    user = user._get_current_object()
+    targets = request.form.getlist('targets[]')
+
+    if not targets:
+        return jsonify(error='No target platform.'), 400
+
+    unknown = [target for target in targets if target.upper() not in PLATFORM_CLIENTS]
+    if unknown:
+        return jsonify(error=f"Unknown platforms: {', '.join(unknown)}."), 400
+
+    if 'async' in request.args:
+        return _enqueue_crosspost(user, targets)
+
+    platforms = {}
+    futures = {}
+    post_draft = PostDraft(request)
+
+    try:
+        # Uploads are bound to the request and files_url are downloaded here, once for every target
+        post_draft.media
+
+        for platform_name in dict.fromkeys(targets):
+            if not is_connected(user, platform_name.upper()):
+                platforms[platform_name] = {'status': 'not_connected'}
+                continue
+
+            page = request.form.get(f'{platform_name}_page', None)
+            futures[platform_name] = crosspost_executor.submit(call_in_app_context, _publish, user,
+                                                               platform_name.upper(), page, post_draft)
+
+        # A post that is still uploading can't be abandoned without risking a duplicate on retry
+        wait(futures.values())
+    finally:
+        post_draft.close()
+
+    for platform_name, future in futures.items():
+        if future.exception():
+            app.logger.error(f'Cross-posting failed for {platform_name}: {future.exception()!r}')
+            platforms[platform_name] = {'status': 'error', 'error': str(future.exception())}
+        else:
+            PlatformView.published(future.result())
+            platforms[platform_name] = {'status': 'ok'}
+
+    db.session.commit()
+
+    posted = all(platform['status'] == 'ok' for platform in platforms.values())
+    return jsonify(platforms=platforms), 201 if posted else 207
@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import jsonify, request
+from models.api.store import PostStore
+from utils.auth import verified_user_required, PLATFORM_CLIENTS, is_connected, get_client, call_in_app_context
+from app import app
+from time import monotonic
+import utils.http
+import os
+
+DASHBOARD_TIMEOUT = float(os.getenv('DASHBOARD_PLATFORM_TIMEOUT', 10))
+
+dashboard_executor = ThreadPoolExecutor(max_workers=int(os.getenv('DASHBOARD_WORKERS', 12)),
+                                        thread_name_prefix='dashboard')
+
+
+def _platform_dashboard(user, platform_name, page, ranking_key, started_at):
+    started_at[platform_name] = monotonic()
+
+    # The platform calls give up once the request stops waiting for them, so an abandoned platform frees its worker
+    with utils.http.deadline(DASHBOARD_TIMEOUT):
+        client = get_client(user, platform_name, page)
+        posts = PostStore(client, user.id).get_posts()['posts']
+
+        return {
+            'status': 'ok',
+            'profile': client.get_profile(),
+            'posts': posts,
+            'posts_stats': client.posts_stats(posts),
+            'posts_ranked': client.get_posts_ranked(ranking_key, posts)['posts']
+        }
+
+
+def _wait(futures, started_at, submitted_at):
+    # Every platform gets DASHBOARD_TIMEOUT from the moment a worker picks it up. One still queued after as long is
+    # cancelled, the pool is shared with the other requests.
+    pending = set(futures)
+
+    while pending:
+        now = monotonic()
+
+        for platform_name in list(pending):
+            future = futures[platform_name]
+            if future.done():
+                pending.discard(platform_name)
+            elif platform_name in started_at:
+                if now - started_at[platform_name] >= DASHBOARD_TIMEOUT:
+                    pending.discard(platform_name)
+            elif now - submitted_at >= DASHBOARD_TIMEOUT and future.cancel():
+                pending.discard(platform_name)
+
+        if pending:
+            timeout = min(started_at.get(platform_name, submitted_at) + DASHBOARD_TIMEOUT - now
+                          for platform_name in pending)
+            wait([futures[platform_name] for platform_name in pending], timeout=max(timeout, 0.05),
+                 return_when=FIRST_COMPLETED)
+
+
+@app.route('/dashboard')
+@verified_user_required
+def dashboard(user):
+    # current_user is a proxy bound to the request, the worker threads need the user object itself
+    user = user._get_current_object()
+    ranking_key = request.args.get('by', 'likes')
+    platforms = {}
+    futures = {}
+    started_at = {}
+    submitted_at = monotonic()
+
+    for platform_name in PLATFORM_CLIENTS:
+        if not is_connected(user, platform_name):
+            platforms[platform_name.lower()] = {'status': 'not_connected'}
+            continue
+
+        page = request.args.get(f'{platform_name.lower()}_page', None)
+        futures[platform_name] = dashboard_executor.submit(call_in_app_context, _platform_dashboard, user,
+                                                           platform_name, page, ranking_key, started_at)
+
+    _wait(futures, started_at, submitted_at)
+
+    for platform_name, future in futures.items():
+        if not future.done() or future.cancelled():
+            platforms[platform_name.lower()] = {'status': 'timeout'}
+        elif future.exception():
+            app.logger.error(f'Dashboard failed for {platform_name}: {future.exception()!r}')
+            platforms[platform_name.lower()] = {'status': 'error', 'error': str(future.exception())}
+        else:
+            platforms[platform_name.lower()] = future.result()
+
+    return jsonify(platforms=platforms)
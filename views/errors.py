@@ -4,8 +4,8 @@ import oauthlib.oauth2 as oauth2
 import jwt.exceptions
 from smtplib import SMTPException
 from sqlalchemy.exc import SQLAlchemyError
-from twitter.error import TwitterError
-from models.api.linkedin import LinkedInError
+from models.api.linkedin.error import LinkedInError
+from models.api.rate_limit import RateLimitError
 import utils.mail
 from app import app
 import os
@@ -14,6 +14,9 @@ import os
 if os.getenv('REWRITE_ERROR_OUTPUT'):
     # Warning: If you set REWRITE_ERROR_OUTPUT you won't longer get Python's default tracklog for your exception
 
+    # Importing the error loads python-twitter as a whole, so it is only done when its handler is registered
+    from twitter.error import TwitterError
+
     @app.errorhandler(500)
     def internal_error_handler(e):
         app.logger.error(str(e))
@@ -62,6 +65,10 @@ if os.getenv('REWRITE_ERROR_OUTPUT'):
         utils.mail.send_internal_error_email(e.message)
         return jsonify(error='Internal server error.'), 500
 
+    @app.errorhandler(RateLimitError)
+    def rate_limit_error_handler(e):
+        return jsonify(error=e.message), 429, {'Retry-After': str(int(e.retry_after) + 1)}
+
     @app.errorhandler(TwitterError)
     def twitter_error(e):
         return jsonify(e.message), 500
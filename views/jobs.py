@@ -0,0 +1,15 @@
+from flask import jsonify
+from models.database import Job
+from utils.auth import verified_user_required
+from app import app
+
+
+@app.route('/jobs/<int:job_id>')
+@verified_user_required
+def job_status(user, job_id):
+    job = Job.query.filter_by(id=job_id, user_id=user.id).first()
+
+    if not job:
+        return jsonify(error='Job not found.'), 404
+
+    return jsonify(job.as_dict())
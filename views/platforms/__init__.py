@@ -5,6 +5,7 @@ from app import app
 from .linkedin import LinkedInView
 from .tumblr import TumblrView
 from .twitter import TwitterView
+from .cache import response_cache
 
 
 def add_route(blueprint, route, func, **kwargs):
@@ -17,12 +18,19 @@ def create_std_platform(platform_name, platform_cls, platform_auth_validator):
     add_route(platform_view, '/auth', auth.platform_auth(platform_cls.auth))
     add_route(platform_view, '/auth/callback', auth.platform_callback(platform_cls.auth_callback))
 
-    add_route(platform_view, '/profile', platform_auth_validator(platform_cls.profile))
+    add_route(platform_view, '/profile',
+              platform_auth_validator(response_cache.cached('profile', 5 * 60)(platform_cls.profile)))
+    add_route(platform_view, '/rate_limit', platform_auth_validator(platform_cls.rate_limit))
     add_route(platform_view, '/profile/stats', platform_auth_validator(platform_cls.get_followers_stats))
 
-    add_route(platform_view, '/profile/posts', platform_auth_validator(platform_cls.get_posts))
-    add_route(platform_view, '/profile/posts/ranked', platform_auth_validator(platform_cls.get_posts_ranked))
-    add_route(platform_view, '/profile/posts/stats', platform_auth_validator(platform_cls.posts_stats))
+    add_route(platform_view, '/profile/posts',
+              platform_auth_validator(response_cache.cached('posts', 2 * 60, synced=True)(platform_cls.get_posts)))
+    add_route(platform_view, '/profile/posts/ranked',
+              platform_auth_validator(response_cache.cached('posts_ranked', 2 * 60, synced=True)(
+                  platform_cls.get_posts_ranked)))
+    add_route(platform_view, '/profile/posts/stats',
+              platform_auth_validator(response_cache.cached('posts_stats', 2 * 60, synced=True)(
+                  platform_cls.posts_stats)))
     add_route(platform_view, '/profile/posts/stats/timeline', platform_auth_validator(platform_cls.get_general_stats))
 
     add_route(platform_view, '/post/<post_id>', platform_auth_validator(platform_cls.post_endpoint),
@@ -0,0 +1,54 @@
+from flask import request, make_response
+from functools import wraps
+from models.api.store import PostStore
+from utils.cache import TTLCache
+import utils.auth as auth
+import os
+
+
+class ResponseCache:
+    # Successful GET responses are kept per account (user, platform, page) and query string. The key also holds the
+    # version of the account's stored posts, which every sync and write changes in the database, so a post published
+    # or deleted through any worker (or the job queue) orphans every response cached for it until they are evicted.
+
+    def __init__(self, max_size):
+        self._responses = TTLCache(max_size, ttl=60)
+
+    # synced is for endpoints served from the post store: it is synced before the key is built, so that the response
+    # is stored under the version it is computed from rather than the one the sync is about to replace
+    def cached(self, endpoint, ttl, synced=False):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(client, *args, **kwargs):
+                user_id = auth.get_authenticated_user().id
+                store = PostStore(client, user_id)
+                refresh = 'refresh' in request.args or 'no-cache' in request.headers.get('Cache-Control', '')
+
+                if synced:
+                    # ?refresh bypasses both the response cache and the post store's sync interval
+                    store.sync(force='refresh' in request.args)
+
+                account = (user_id, client.PLATFORM.name, client.page_id)
+                query = tuple(sorted((arg, tuple(values)) for arg, values in request.args.lists() if arg != 'refresh'))
+                key = (account, store.version(), endpoint, query)
+
+                if not refresh:
+                    data = self._responses.get(key)
+                    if data is not None:
+                        response = make_response(data)
+                        response.mimetype = 'application/json'
+                        response.headers['X-Cache'] = 'HIT'
+                        return response
+
+                response = make_response(func(client, *args, **kwargs))
+                if response.status_code == 200:
+                    self._responses.set(key, response.get_data(), ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+
+            return wrapper
+
+        return decorator
+
+
+response_cache = ResponseCache(max_size=int(os.getenv('RESPONSE_CACHE_SIZE', 2048)))
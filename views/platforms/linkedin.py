@@ -1,9 +1,11 @@
 from flask import redirect, request, jsonify
 from .platform import PlatformView
 from models.database import LinkedInToken, DefaultPage
-from models.api import LinkedInAPI
+import models.api as api
 from utils.auth import current_user
 import utils.request
+from models.api.pool import client_pool
+import utils.auth as auth
 from app import app, db
 from datetime import datetime
 
@@ -13,11 +15,11 @@ class LinkedInView(PlatformView):
 
     @staticmethod
     def auth():
-        return redirect(LinkedInAPI.generate_auth_url(LinkedInView.CALLBACK_URL))
+        return redirect(api.LinkedInAPI.generate_auth_url(LinkedInView.CALLBACK_URL))
 
     @staticmethod
     def auth_callback(user):
-        token = LinkedInAPI.generate_auth_token(LinkedInView.CALLBACK_URL, request.url)
+        token = api.LinkedInAPI.generate_auth_token(LinkedInView.CALLBACK_URL, request.url)
         access_token = token['access_token']
         access_token_exp = datetime.fromtimestamp(token['expires_at'])
 
@@ -30,6 +32,8 @@ class LinkedInView(PlatformView):
             token_record.token, token_record.expires_at = access_token, access_token_exp
 
         db.session.commit()
+        client_pool.invalidate(user.id, 'LINKEDIN')
+        auth.forget_user(user.id)
 
         return jsonify(message='Authentication succeeded.'), 200
 
@@ -40,14 +44,12 @@ class LinkedInView(PlatformView):
     @staticmethod
     def default_page(client):
         if request.method == 'GET':
-            default_page = DefaultPage.query.filter_by(user_id=current_user.id,
-                                                       platform_id=client.PLATFORM.id).first()
-            if default_page:
-                default_page = default_page.page_id
-            return jsonify(default_page=default_page)
+            return jsonify(default_page=current_user.default_page(client.PLATFORM.id))
         if request.method == 'POST' or request.method == 'PUT':
             new_default_page = utils.request.form_get('default_page')
-            if new_default_page not in client.get_companies_id():
+            # The administered organizations are cached, a miss may just mean the user was granted a new page
+            if new_default_page not in client.get_companies_id() and \
+                    new_default_page not in client.get_companies_id(refresh=True):
                 return jsonify(error='Invalid company URN.'), 400
 
             default_page = DefaultPage.query.filter_by(user_id=current_user.id,
@@ -58,4 +60,5 @@ class LinkedInView(PlatformView):
                 db.session.add(DefaultPage(current_user.id, client.PLATFORM.id, new_default_page))
 
             db.session.commit()
+            auth.forget_user(current_user.id)
             return jsonify(message="Default page updated successfully.")
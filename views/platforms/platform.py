@@ -1,10 +1,12 @@
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context
 from models import PostDraft
 from models.database import FollowersCount, Stats
+from models.api.store import PostStore
+import models.jobs as jobs
+import models.timeline as timeline
 import utils.auth as auth
 from app import db
 from datetime import datetime
-from statistics import mean
 
 
 class PlatformView:
@@ -26,25 +28,56 @@ class PlatformView:
 
         elif request.method == 'DELETE':
             client.delete_post(post_id)
+            PostStore(client, auth.get_authenticated_user().id).forget(post_id)
             return jsonify(message='Post deleted.')
 
     @staticmethod
     def get_posts(client):
-        return jsonify(client.get_posts())
+        return jsonify(PlatformView._stored_posts(client))
 
     @staticmethod
     def post(client):
-        client.post(PostDraft(request))
-        followers_row = FollowersCount(auth.get_authenticated_user().id, client.PLATFORM.id,
-                                       client.get_profile()['followers'], False)
-        db.session.add(followers_row)
+        if 'async' in request.args:
+            return PlatformView.enqueue_post(client)
+
+        post_draft = PostDraft(request)
+        try:
+            client.post(post_draft)
+        finally:
+            post_draft.close()
+
+        PlatformView.published(client)
         db.session.commit()
         return jsonify(message='Posted successfully.'), 201
 
+    @staticmethod
+    def enqueue_post(client):
+        # Publishing in the background, poll GET /jobs/<job_id> for the outcome
+        if request.files.getlist('files[]'):
+            return jsonify(error='Uploaded files can only be posted synchronously, use files_url[] instead.'), 400
+
+        job = jobs.enqueue('publish', {
+            'platform': client.PLATFORM.name,
+            'page': client.page_id or None,
+            'draft': PostDraft(request).as_dict()
+        }, user_id=auth.get_authenticated_user().id, max_attempts=1)
+        db.session.commit()
+
+        return jsonify(job_id=job.id), 202
+
+    @staticmethod
+    def published(client):
+        # Bookkeeping after a successful post, left to the caller to commit. The followers count is taken by the job
+        # worker so that the response doesn't wait on the platform's profile calls.
+        user_id = auth.get_authenticated_user().id
+        PostStore(client, user_id).expire()
+        jobs.enqueue_followers_snapshot(client, user_id)
+
     @staticmethod
     def posts_stats(client):
         if 'date_begin' not in request.args:
-            return jsonify(client.posts_stats())
+            posts = PlatformView._stored_posts(client)['posts']
+            return jsonify(client.posts_stats(posts))
 
         date_begin = datetime.fromtimestamp(float(request.args.get('date_begin', 0)))
 
@@ -54,26 +87,17 @@ class PlatformView:
         else:
             date_end = datetime.utcnow()
 
-        entries = Stats.query.filter_by(
-            user_id=auth.get_authenticated_user().id,
-            platform_id=client.PLATFORM.id
-        ).filter(Stats.timestamp.between(date_begin, date_end)).order_by(Stats.timestamp.desc()).all()
-
-        stats = {
-            'likes_sum': sum(entry.likes_sum for entry in entries),
-            'shares_sum': sum(entry.shares_sum for entry in entries),
-            'comments_sum': sum(entry.comments_sum for entry in entries),
-
-            'likes_avg': mean((entry.likes_sum for entry in entries) or [0]),
-            'shares_avg': mean((entry.likes_sum for entry in entries) or [0]),
-            'comments_avg': mean((entry.likes_sum for entry in entries) or [0])
-        }
+        return jsonify(timeline.stats_summary(auth.get_authenticated_user().id, client.PLATFORM.id,
+                                              date_begin, date_end))
 
-        return jsonify(stats)
+    @staticmethod
+    def rate_limit(client):
+        return jsonify(client.rate_limit_budget())
 
     @staticmethod
     def get_posts_ranked(client):
-        return jsonify(client.get_posts_ranked(request.args.get('by', 'likes')))
+        posts = PlatformView._stored_posts(client)['posts']
+        return jsonify(client.get_posts_ranked(request.args.get('by', 'likes'), posts))
 
     @staticmethod
     def get_followers_stats(platform_cls):
@@ -85,12 +109,13 @@ class PlatformView:
         else:
             date_end = datetime.utcnow()
 
-        followers_count = FollowersCount.query.filter_by(
-            user_id=auth.get_authenticated_user().id,
-            platform_id=platform_cls.PLATFORM.id
-        ).filter(FollowersCount.timestamp.between(date_begin, date_end)).order_by(FollowersCount.timestamp.desc()).all()
+        if 'bucket' in request.args or 'max_points' in request.args:
+            bucket, max_points = PlatformView._bucketing(date_begin, date_end)
+            return jsonify(bucket=bucket, followers_count=timeline.followers_timeline(
+                auth.get_authenticated_user().id, platform_cls.PLATFORM.id, date_begin, date_end, bucket, max_points))
 
-        return jsonify(followers_count=list(map(FollowersCount.as_dict, followers_count)))
+        return PlatformView._rows('followers_count', FollowersCount, timeline.FOLLOWERS_FIELDS, platform_cls,
+                                  date_begin, date_end)
 
     @staticmethod
     def get_general_stats(platform_cls):
@@ -102,9 +127,38 @@ class PlatformView:
         else:
             date_end = datetime.utcnow()
 
-        entries = Stats.query.filter_by(
-            user_id=auth.get_authenticated_user().id,
-            platform_id=platform_cls.PLATFORM.id
-        ).filter(Stats.timestamp.between(date_begin, date_end)).order_by(Stats.timestamp.desc()).all()
+        if 'bucket' in request.args or 'max_points' in request.args:
+            bucket, max_points = PlatformView._bucketing(date_begin, date_end)
+            return jsonify(bucket=bucket, entries=timeline.stats_timeline(
+                auth.get_authenticated_user().id, platform_cls.PLATFORM.id, date_begin, date_end, bucket, max_points))
+
+        return PlatformView._rows('entries', Stats, timeline.STATS_FIELDS, platform_cls, date_begin, date_end)
+
+    @staticmethod
+    def _rows(key, raw_cls, fields, platform_cls, date_begin, date_end):
+        user_id = auth.get_authenticated_user().id
+        cursor = request.args.get('cursor', None)
+
+        if 'stream' in request.args:
+            return Response(stream_with_context(timeline.rows_json_stream(
+                key, raw_cls, fields, user_id, platform_cls.PLATFORM.id, date_begin, date_end, cursor)),
+                mimetype='application/json')
 
-        return jsonify(entries=list(map(Stats.as_dict, entries)))
+        if cursor or 'limit' in request.args:
+            limit = min(int(request.args.get('limit', timeline.PAGE_SIZE)), timeline.MAX_PAGE_SIZE)
+            entries, next_cursor = timeline.rows_page(raw_cls, fields, user_id, platform_cls.PLATFORM.id,
+                                                      date_begin, date_end, cursor, limit)
+            return jsonify(**{key: entries}, next_cursor=next_cursor)
+
+        return jsonify(**{key: timeline.rows_all(raw_cls, fields, user_id, platform_cls.PLATFORM.id,
+                                                 date_begin, date_end)})
+
+    @staticmethod
+    def _bucketing(date_begin, date_end):
+        max_points = min(int(request.args.get('max_points', timeline.MAX_POINTS)), timeline.MAX_POINTS)
+        return timeline.pick_bucket(date_begin, date_end, request.args.get('bucket', None), max_points), max_points
+
+    @staticmethod
+    def _stored_posts(client):
+        # Synced by the response cache beforehand, ?refresh included
+        return PostStore(client, auth.get_authenticated_user().id).get_posts()
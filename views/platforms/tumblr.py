@@ -1,7 +1,9 @@
 from flask import session, redirect, request, jsonify
 from .platform import PlatformView
 from models.database import TumblrToken
-from models.api import TumblrAPI
+import models.api as api
+from models.api.pool import client_pool
+import utils.auth as auth
 from app import db
 
 
@@ -9,15 +11,15 @@ class TumblrView(PlatformView):
 
     @staticmethod
     def auth():
-        oauth_token, oauth_token_secret = TumblrAPI.generate_auth_req_token()
+        oauth_token, oauth_token_secret = api.TumblrAPI.generate_auth_req_token()
 
         session['tumblr_req_auth_token'], session['tumblr_req_auth_token_secret'] = oauth_token, oauth_token_secret
 
-        return redirect(TumblrAPI.generate_auth_url(oauth_token))
+        return redirect(api.TumblrAPI.generate_auth_url(oauth_token))
 
     @staticmethod
     def auth_callback(user):
-        oauth_token, oauth_token_secret = TumblrAPI.generate_auth_token(
+        oauth_token, oauth_token_secret = api.TumblrAPI.generate_auth_token(
             request.url,
             session['tumblr_req_auth_token'],
             session['tumblr_req_auth_token_secret']
@@ -30,5 +32,7 @@ class TumblrView(PlatformView):
 
         db.session.add(token_record)
         db.session.commit()
+        client_pool.invalidate(user.id, 'TUMBLR')
+        auth.forget_user(user.id)
 
         return jsonify(message='Authentication succeeded.'), 200
@@ -1,7 +1,9 @@
 from flask import session, redirect, request, jsonify
 from .platform import PlatformView
 from models.database import TwitterToken
-from models.api import TwitterAPI
+import models.api as api
+from models.api.pool import client_pool
+import utils.auth as auth
 from app import db
 
 
@@ -9,15 +11,15 @@ class TwitterView(PlatformView):
 
     @staticmethod
     def auth():
-        oauth_token, oauth_token_secret = TwitterAPI.generate_auth_req_token()
+        oauth_token, oauth_token_secret = api.TwitterAPI.generate_auth_req_token()
 
         session['twitter_req_auth_token'], session['twitter_req_auth_token_secret'] = oauth_token, oauth_token_secret
 
-        return redirect(TwitterAPI.generate_auth_url(oauth_token))
+        return redirect(api.TwitterAPI.generate_auth_url(oauth_token))
 
     @staticmethod
     def auth_callback(user):
-        oauth_token, oauth_token_secret = TwitterAPI.generate_auth_token(session['twitter_req_auth_token'],
+        oauth_token, oauth_token_secret = api.TwitterAPI.generate_auth_token(session['twitter_req_auth_token'],
                                                                          session['twitter_req_auth_token_secret'],
                                                                          request.args['oauth_verifier'])
         session.pop('twitter_req_auth_token')
@@ -26,5 +28,7 @@ class TwitterView(PlatformView):
         token_record = TwitterToken(user, oauth_token, oauth_token_secret)
         db.session.add(token_record)
         db.session.commit()
+        client_pool.invalidate(user.id, 'TWITTER')
+        auth.forget_user(user.id)
 
         return jsonify(message='Authentication succeeded.'), 200